@@ -0,0 +1,79 @@
+import functools
+import re
+
+EPISODE_REGEX = re.compile(r'(?i)(?<![a-z0-9])s(?P<season>\d{1,2})\W?e(?P<episode>\d{1,3})'
+                           r'(?:-?e(?P<last>\d{1,3})|-(?P<last_dash>\d{1,3}))?(?!\d)')
+SEASON_REGEX = re.compile(r'(?i)(?<![a-z0-9])(?:s(?P<season>\d{1,2})(?:-s?(?P<last>\d{1,2}))?(?![\de])|'
+                          r'season\W?(?P<season_long>\d{1,2})(?:-(?P<last_long>\d{1,2}))?(?!\d))')
+# Only as a whole token, "DD5.1x264" and "1920x1080" are no episodes
+X_EPISODE_REGEX = re.compile(r'(?i)(?<![\w.])(?P<season>\d{1,2})x(?P<episode>\d{1,3})(?!\d)')
+QUALITY_REGEX = re.compile(r'(?i)(?<![a-z0-9])(2160p|1080p|720p|480p|HDTV|WEB-?DL|WEB-?Rip|BluRay|BDRip|DVDRip)')
+CODEC_REGEX = re.compile(r'(?i)(?<![a-z0-9])([hx]\.?26[45]|HEVC|AVC|XviD)')
+CODEC_NAMES = {'264': 'x264', '265': 'x265', 'hevc': 'x265', 'avc': 'x264', 'xvid': 'xvid'}
+
+
+class ReleaseName:
+    """ Structured record of a release title or filename, like "Supergirl.S02E13-E14.720p.HDTV.x264-LOL" """
+    def __init__(self, title):
+        self.title = title
+        self.season = None
+        # All seasons of a multi-season pack, like "S01-S03"
+        self.seasons = ()
+        self.episodes = ()
+        self.quality = self.codec = None
+
+        marker = EPISODE_REGEX.search(title)
+        season_marker = SEASON_REGEX.search(title) if marker is None else None
+        if marker is None and season_marker is None:
+            marker = X_EPISODE_REGEX.search(title)
+        if marker:
+            self.season = int(marker.group('season'))
+            first = int(marker.group('episode'))
+            last = int(marker.groupdict().get('last') or marker.groupdict().get('last_dash') or first)
+            self.episodes = tuple(range(first, max(first, last) + 1))
+            self.seasons = (self.season,)
+        elif season_marker:
+            marker = season_marker
+            self.season = int(marker.group('season') or marker.group('season_long'))
+            last = int(marker.group('last') or marker.group('last_long') or self.season)
+            self.seasons = tuple(range(self.season, max(self.season, last) + 1))
+
+        self.show_tokens = tuple(re.findall(r'[a-z0-9]+', title[:marker.start() if marker else len(title)].lower()))
+
+        quality = QUALITY_REGEX.search(title)
+        if quality:
+            self.quality = quality.group(1).lower().replace('-', '')
+        codec = CODEC_REGEX.search(title)
+        if codec:
+            codec_ = codec.group(1).lower().replace('.', '')
+            self.codec = CODEC_NAMES.get(codec_[-3:] if codec_[-3:] in ('264', '265') else codec_)
+
+    @property
+    def is_season_pack(self):
+        return self.season is not None and not self.episodes
+
+    def get_keys(self):
+        """ The (season, episode) keys this release contains, (season, None) for each season of a season pack """
+        if self.season is None:
+            return []
+        if self.is_season_pack:
+            return [(season, None) for season in self.seasons]
+        return [(self.season, episode) for episode in self.episodes]
+
+    def __repr__(self):
+        return 'ReleaseName({!r}: s{} e{} {} {})'.format(self.title, self.season, self.episodes,
+                                                         self.quality, self.codec)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def parse_release_name(title):
+    return ReleaseName(title)
+
+
+def index_by_episode(items, key=lambda item: item):
+    """ Map (season, episode) - or (season, None) for season packs - to the items whose names contain them """
+    index = {}
+    for item in items:
+        for key_ in parse_release_name(key(item)).get_keys():
+            index.setdefault(key_, []).append(item)
+    return index
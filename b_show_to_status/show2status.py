@@ -2,6 +2,7 @@ import logging
 import os
 import re
 
+from a_argument_to_show.release_name import index_by_episode
 from b_show_to_status.show_status import Status
 
 
@@ -19,7 +20,8 @@ class Show2Status:
             if season_.number == 0:
                 continue
             episodes = self._get_episodes_missing(show_, season_, dl_directory_)
-            if len(episodes) > 0.9*len(season_.episodes):
+            # Whether a season pack is cheaper than the episodes is decided with the search results later on
+            if episodes and len(episodes) == len(season_.get_aired_episodes()):
                 seasons_missing.append(season_)
             else:
                 episodes_missing.extend(episodes)
@@ -61,8 +63,10 @@ class Show2Status:
             most_likely_directory = max(files_in_dirs, key=lambda f: f[1])[0]
             episodes = os.listdir(os.path.join(show_directory, most_likely_directory))
 
+        # Unfinished downloads are not there yet
+        episodes_on_disk = index_by_episode([e for e in episodes if not re.search(r'\.part(\.json)?(\.tmp)?$', e)])
         return [episode for episode in season.get_aired_episodes()
-                if [e for e in episodes if episode.get_regex().search(e)]]
+                if (episode.season, episode.episode) in episodes_on_disk]
 
     def __bool__(self):
         return True
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+""" Download 1, 100 and 1000 references with every strategy of Torrent2Download against a fake downloader.
+
+The fake answers every call after a short latency, finishes transfers after a fixed time and counts the calls.
+Downloading a transfer that is not finished waits for it, a dead one fails after the stall timeout.
+10% of the best links are dead and 10% are cached. All times are scaled down, the poller runs every 10ms.
+
+Run from the repository root: python -m benchmarks.bench_download_engine """
+import asyncio
+import itertools
+import logging
+import tempfile
+import time
+
+from a_argument_to_show.thetvdb_api import TheTVDBAPI, TVDBShow, Episode
+from c_status_to_torrent.status2torrent import Torrent
+from d_torrent_to_download.torrent2download import DOWNLOADERS, Torrent2Download
+from manager import Information
+
+REFERENCES = (1, 100, 1000)
+API_LATENCY = .001
+TRANSFER_TIME = .05
+DOWNLOAD_TIME = .02
+STALL_TIMEOUT = .2
+EPISODES_PER_SEASON = 25
+
+
+class FakeTransfer:
+    def __init__(self, transfer_id, link, finished_at):
+        self.id = transfer_id
+        self.name = link
+        self.src = link
+        self.hash = link.split('btih:')[-1][:40]
+        self.progress = 0.
+        self.finished_at = finished_at
+
+
+class FakeDownloader:
+    def __init__(self, login, event_loop):
+        self.event_loop = event_loop
+        self.transfers = {}
+        self.ids = itertools.count()
+        self.calls = {}
+
+    async def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        await asyncio.sleep(API_LATENCY)
+
+    def _update(self, transfer):
+        if transfer.finished_at is not None:
+            transfer.progress = 1. if self.event_loop.time() >= transfer.finished_at else .5
+        return transfer
+
+    async def upload(self, link):
+        await self._call('upload')
+        if 'dead' in link:
+            finished_at = None
+        else:
+            finished_at = self.event_loop.time() + (0 if 'cached' in link else TRANSFER_TIME)
+        transfer = FakeTransfer(next(self.ids), link, finished_at)
+        self.transfers[transfer.id] = transfer
+        return transfer
+
+    async def get_transfers(self):
+        await self._call('get_transfers')
+        return [self._update(transfer) for transfer in self.transfers.values()]
+
+    async def get_transfer(self, transfer):
+        await self._call('get_transfer')
+        return self._update(self.transfers[transfer.id]) if transfer.id in self.transfers else None
+
+    def is_transfer_finished(self, transfer, start_time):
+        return True if transfer.progress >= 1 else None
+
+    async def check_cache(self, infohashes):
+        await self._call('check_cache')
+        return [infohash for infohash in infohashes if infohash.startswith('c')]
+
+    async def get_file_from_transfer(self, transfer):
+        await self._call('get_file_from_transfer')
+        return transfer
+
+    async def download_file(self, file_, download_directory):
+        return await self.download_transfer(file_, download_directory)
+
+    async def download_transfer(self, transfer, download_directory):
+        """ Waits for the transfer to finish first, like the downloader does when it is not polled before """
+        await self._call('download')
+        transfer = self.transfers.get(transfer.id)
+        if transfer is None or transfer.finished_at is None:
+            await asyncio.sleep(STALL_TIMEOUT)
+            return False
+        await asyncio.sleep(max(0., transfer.finished_at - self.event_loop.time()) + DOWNLOAD_TIME)
+        return True
+
+    async def delete(self, transfer):
+        await self._call('delete')
+        self.transfers.pop(transfer.id, None)
+
+    async def close(self):
+        pass
+
+    def __bool__(self):
+        return True
+
+
+def get_information(count, download_directory):
+    show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759}, TheTVDBAPI(test=True))
+    show.imdb_id = 'tt4016454'
+    torrents = []
+    for i in range(count):
+        episode = Episode(show, {'airedSeason': i // EPISODES_PER_SEASON + 1,
+                                 'airedEpisodeNumber': i % EPISODES_PER_SEASON + 1, 'episodeName': str(i)})
+        show._add_episode(episode)
+        # 10% of the best links are dead, 10% cached, the second link always works
+        kind = 'dead' if i % 10 == 0 else ('cached' if i % 10 == 1 else 'ok')
+        prefix = 'c' if kind == 'cached' else 'a'
+        links = ['magnet:?xt=urn:btih:{}{:039x}&dn={}{}&'.format(prefix, i, kind, i),
+                 'magnet:?xt=urn:btih:b{:039x}&dn=ok{}&'.format(i, i)]
+        torrents.append(Torrent.from_links(episode, links))
+
+    information = Information(download_directory)
+    information.show = show
+    information.torrents = torrents
+    return information
+
+
+def run(strategy, count):
+    event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(event_loop)
+    with tempfile.TemporaryDirectory() as download_directory:
+        information = get_information(count, download_directory)
+        torrent2download = Torrent2Download(None, event_loop, parallel_links=2, stall_timeout=STALL_TIMEOUT,
+                                            segments=0, per_show_downloads=Torrent2Download.CONCURRENT_DOWNLOADS,
+                                            downloader='benchmark', strategy=strategy)
+        poller = torrent2download.transfer_poller
+        poller.fast = poller.normal = poller.slow = poller.interval = .01
+
+        start = time.perf_counter()
+        event_loop.run_until_complete(torrent2download.download(information))
+        duration = time.perf_counter() - start
+
+        calls = torrent2download.torrent_downloader.calls
+        event_loop.run_until_complete(torrent2download.close())
+    event_loop.close()
+    return duration, calls
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    DOWNLOADERS['benchmark'] = FakeDownloader
+    print('{:>10} {:>5} {:>8} {:>7} {:>7} {:>9} {:>7}'.format('strategy', 'refs', 'seconds', 'calls', 'uploads',
+                                                                'transfers', 'deletes'))
+    for count in REFERENCES:
+        for strategy in Torrent2Download.STRATEGIES:
+            duration, calls = run(strategy, count)
+            print('{:>10} {:>5} {:>8.2f} {:>7} {:>7} {:>9} {:>7}'.format(
+                strategy, count, duration, sum(calls.values()), calls.get('upload', 0),
+                calls.get('get_transfers', 0) + calls.get('get_transfer', 0), calls.get('delete', 0)))
+
+
+if __name__ == '__main__':
+    main()
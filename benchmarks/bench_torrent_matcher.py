@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+""" Filter 100k synthetic search results, with the per-result regex compilation and the cached matcher.
+
+Run from the repository root: python -m benchmarks.bench_torrent_matcher """
+import random
+import re
+import time
+
+from a_argument_to_show.thetvdb_api import TheTVDBAPI, TVDBShow, Episode
+from c_status_to_torrent.piratebay import PirateBayResult
+from c_status_to_torrent.status2torrent import QUALITY_REGEX, Status2Torrent
+
+TITLES = 100000
+
+
+def synthetic_results(count, seed=0):
+    random_ = random.Random(seed)
+    shows = ['Supergirl', 'Super Girl', 'The Flash', 'Doctor Who', 'Supernatural']
+    qualities = ['720p', '1080p', 'HDTV', 'WEB-DL', '480p', '']
+    encoders = ['x264', 'H264', 'x265', 'XviD', '']
+    results = []
+    for _ in range(count):
+        title = '{}.S{:02}E{:02}.{}.{}-GRP'.format(random_.choice(shows), random_.randint(1, 4),
+                                                   random_.randint(1, 22), random_.choice(qualities),
+                                                   random_.choice(encoders))
+        results.append(PirateBayResult.from_dict({'title': title}))
+    return results
+
+
+def filter_uncached(results, type_, show, quality):
+    """ The filter as it was before the TorrentMatcher: compile and scan four regexes per result """
+    def matches(result):
+        for filter_re in [re.compile(re.sub(r'\W', '.?', show.name)),
+                          type_.get_regex(),
+                          QUALITY_REGEX['encoder'].get(quality.get('encoder')),
+                          QUALITY_REGEX['quality'].get(quality.get('quality'))]:
+            if filter_re and not filter_re.search(result.title):
+                return False
+        return True
+    return [result for result in results if matches(result)]
+
+
+def main():
+    show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759, 'firstAired': '2015-10-26'}, TheTVDBAPI(test=True))
+    episode = Episode(show, {'airedSeason': 2, 'airedEpisodeNumber': 13, 'episodeName': 'Luthors'})
+    quality = {'quality': '720', 'encoder': '264'}
+    results = synthetic_results(TITLES)
+
+    start = time.perf_counter()
+    uncached = filter_uncached(results, episode, show, quality)
+    uncached_time = time.perf_counter() - start
+
+    status2torrent = Status2Torrent.__new__(Status2Torrent)
+    status2torrent.quality, status2torrent._matchers = [quality], {}
+    status2torrent.size_bounds = Status2Torrent.SIZE_BOUNDS
+    start = time.perf_counter()
+    cached = status2torrent.filter_searches(results, episode, show)
+    cached_time = time.perf_counter() - start
+
+    assert [r.title for r in cached] == [r.title for r in uncached]
+    print('{} titles, {} matches'.format(TITLES, len(cached)))
+    print('per-result compilation: {:.3f}s'.format(uncached_time))
+    print('cached matcher:         {:.3f}s ({:.1f}x)'.format(cached_time, uncached_time / cached_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import logging
+import time
+
+
+class CircuitBreaker:
+    """ Track the health of a single proxy.
+
+    closed: requests pass. open: requests are refused until the cool-down is over.
+    half-open: one probe request is let through, its outcome closes or re-opens the circuit."""
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, name, failure_threshold=3, cool_down=60, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def allow_request(self):
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if self.clock() - self.opened_at < self.cool_down:
+                return False
+            logging.debug('Circuit of {} is half-open, probing...'.format(self.name))
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def release_probe(self):
+        """ Let the next request probe again if this one ended without an outcome, e.g. was cancelled """
+        self.probing = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logging.info('Proxy {} is back, closing circuit'.format(self.name))
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.warning('Proxy {} failed {} times, skipping it for {}s'.format(
+                    self.name, self.failures, self.cool_down))
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+
+    def __bool__(self):
+        return self.state != self.OPEN
+
+
+class CircuitBreakerRegistry:
+    def __init__(self, failure_threshold=3, cool_down=60, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.clock = clock
+        self.breakers = {}
+
+    def get(self, name):
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name, self.failure_threshold, self.cool_down, self.clock)
+        return self.breakers[name]
+
+    def available(self, names):
+        return [name for name in names if self.get(name).state != CircuitBreaker.OPEN or
+                self.clock() - self.get(name).opened_at >= self.cool_down]
@@ -1,39 +1,109 @@
 import asyncio
+import datetime
 import aiohttp
 import requests
 import logging
 import bs4
 import re
 
+from c_status_to_torrent.circuit_breaker import CircuitBreakerRegistry
+from c_status_to_torrent.rate_limiter import HostRateLimiterRegistry
+from c_status_to_torrent.search_cache import SearchCache
+
 
 # Encoding errors are expected at weird proxies
 logging.getLogger('chardet.charsetprober').setLevel(logging.INFO)
 
 
 class PirateBayResult:
+    SIZE_UNITS = {'B': 1, 'KIB': 1 << 10, 'MIB': 1 << 20, 'GIB': 1 << 30, 'TIB': 1 << 40,
+                  'KB': 10 ** 3, 'MB': 10 ** 6, 'GB': 10 ** 9, 'TB': 10 ** 12}
+
     def __init__(self, beautiful_soup_tag):
         self.title = self.magnet = ''
         self.seeders = self.leechers = 0
+        self.size = 0
+        self.uploaded = None
+        if beautiful_soup_tag is None:
+            return
         try:
             tds = beautiful_soup_tag.find_all('td')
             self.title = tds[1].a.text
             self.magnet = tds[1].find_all('a')[1].attrs.get('href')
             self.seeders = int(tds[-2].text)
             self.leechers = int(tds[-1].text)
+            description = tds[1].find('font', attrs={'class': 'detDesc'})
+            if description:
+                self.uploaded, self.size = self.parse_description(description.text)
         except (IndexError, ValueError, AttributeError):
             return
 
+    @classmethod
+    def parse_description(cls, description, today=None):
+        """ Parse "Uploaded 02-21 03:03, Size 280.6 MiB, ULed by ettv" to (upload date, size in bytes) """
+        description = description.replace('\xa0', ' ')
+        uploaded, size = None, 0
+        size_match = re.search(r'Size (?P<size>[\d.]+) ?(?P<unit>[KMGT]?i?B)', description)
+        if size_match:
+            size = int(float(size_match.group('size')) * cls.SIZE_UNITS.get(size_match.group('unit').upper(), 1))
+        date_match = re.search(r'Uploaded (?P<date>.+?),', description)
+        if date_match:
+            uploaded = cls.parse_upload_date(date_match.group('date'), today=today)
+        return uploaded, size
+
+    @staticmethod
+    def parse_upload_date(date, today=None):
+        """ Piratebay shows "Today 03:03", "Y-day 03:03", "5 mins ago", "02-21 03:03" (this year) or "02-21 2016" """
+        today = today if today else datetime.date.today()
+        if date.startswith('Today') or 'ago' in date:
+            return today
+        if date.startswith('Y-day'):
+            return today - datetime.timedelta(days=1)
+        match = re.match(r'(?P<month>\d{2})-(?P<day>\d{2}) (?:(?P<year>\d{4})|\d{2}:\d{2})', date)
+        if match:
+            year = int(match.group('year')) if match.group('year') else today.year
+            try:
+                uploaded = datetime.date(year, int(match.group('month')), int(match.group('day')))
+            except ValueError:
+                return None
+            # Without a year, a date after today was uploaded last year
+            if not match.group('year') and uploaded > today:
+                return datetime.date(year - 1, uploaded.month, min(uploaded.day, 28 if uploaded.month == 2 else 31))
+            return uploaded
+
+    def to_dict(self):
+        return {'title': self.title, 'magnet': self.magnet, 'seeders': self.seeders, 'leechers': self.leechers,
+                'size': self.size, 'uploaded': self.uploaded.isoformat() if self.uploaded else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        result = cls(None)
+        result.title = data.get('title', '')
+        result.magnet = data.get('magnet', '')
+        result.seeders = data.get('seeders', 0)
+        result.leechers = data.get('leechers', 0)
+        result.size = data.get('size', 0)
+        if data.get('uploaded'):
+            result.uploaded = datetime.datetime.strptime(data.get('uploaded'), '%Y-%m-%d').date()
+        return result
+
     def __bool__(self):
         return bool(self.title)
 
 
 class PiratebayGrabber:
     proxy_url = "http://proxybay.one"
+    RESULTS_PER_PAGE = 30
 
-    def __init__(self, event_loop):
+    def __init__(self, event_loop, failure_threshold=3, cool_down=300,
+                 requests_per_second=1., burst=5, concurrency_per_host=4, cache_path=None, cache_ttl=None):
         self.event_loop = event_loop
         self.aiohttp_session = None
-        self.max_simultaneous_requests = asyncio.Semaphore(10)
+        self.search_cache = SearchCache(path=cache_path, ttl=cache_ttl)
+        self.rate_limiters = HostRateLimiterRegistry(requests_per_second=requests_per_second, burst=burst,
+                                                     concurrency=concurrency_per_host)
+        self._next_proxy = 0
+        self.circuit_breakers = CircuitBreakerRegistry(failure_threshold=failure_threshold, cool_down=cool_down)
 
         self.parser = PirateBayParser()
 
@@ -61,14 +131,27 @@ class PiratebayGrabber:
                 self.proxies.append(proxy_url)
 
     async def close(self):
+        self.search_cache.save()
         if self.aiohttp_session is not None:
             await self.aiohttp_session.close()
 
-    async def _make_request(self, url, timeout=5):
-        async with self.max_simultaneous_requests:
+    async def _make_request(self, url, timeout=5, circuit_breaker=None):
+        """ The text of the response or None. The circuit breaker sees one outcome per request, not one per retry. """
+        text = await self._request_with_retries(url, timeout)
+        if circuit_breaker is not None:
+            if text is None:
+                circuit_breaker.record_failure()
+            else:
+                circuit_breaker.record_success()
+        return text
+
+    async def _request_with_retries(self, url, timeout):
+        rate_limiter = self.rate_limiters.get(url)
+        async with rate_limiter:
             if self.aiohttp_session is None:
                 self.aiohttp_session = aiohttp.ClientSession(loop=self.event_loop)
             for retry in range(3):
+                await rate_limiter.throttle()
                 try:
                     async with self.aiohttp_session.post(url, timeout=timeout, ssl=False) as r_:
                         text = await r_.text()
@@ -86,16 +169,50 @@ class PiratebayGrabber:
                     return
             logging.warning('Connection to {} failed. Site down?'.format(url[:30]))
 
-    async def search(self, show, object_):
+    async def search(self, show, object_, page=0):
         query = "{} {}".format(show.get_search_query(), object_.str_short())
         query = re.sub(r'[^\w\d\s.]', '', query)
-        for proxy_url in self.proxies:
-            logging.debug('Searching {} for "{}"'.format(proxy_url, query))
-            response = await self._make_request(proxy_url + '/search/{}/0/99/200'.format(query))
+        cache_key = '{} page {}'.format(query, page) if page else query
+
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            logging.debug('Using cached results for "{}"'.format(cache_key))
+            return [PirateBayResult.from_dict(r) for r in cached]
+
+        for proxy_url in self._get_proxy_order():
+            circuit_breaker = self.circuit_breakers.get(proxy_url)
+            if not circuit_breaker.allow_request():
+                continue
+            logging.debug('Searching {} for "{}" (page {})'.format(proxy_url, query, page))
+            try:
+                response = await self._make_request(proxy_url + '/search/{}/{}/99/200'.format(query, page),
+                                                    circuit_breaker=circuit_breaker)
+            finally:
+                # A cancelled probe would otherwise keep the proxy half-open and untried forever
+                circuit_breaker.release_probe()
             if response:
-                return self.parser.parse_piratebay_response(response)
+                results = self.parser.parse_piratebay_response(response)
+                self.search_cache.put(cache_key, [r.to_dict() for r in results if r],
+                                      aired=self._get_air_date(object_))
+                return results
         return []
 
+    @staticmethod
+    def _get_air_date(object_):
+        if hasattr(object_, 'date'):
+            return object_.date
+        dates = [ep.date for ep in getattr(object_, 'episodes', [])]
+        return max(dates) if dates else None
+
+    def _get_proxy_order(self):
+        """ Rotate the healthy proxies, so that consecutive searches start at different hosts """
+        proxies = self.circuit_breakers.available(self.proxies)
+        if not proxies:
+            return []
+        start = self._next_proxy % len(proxies)
+        self._next_proxy += 1
+        return proxies[start:] + proxies[:start]
+
 
 class PirateBayParser:
     @staticmethod
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """ Allow `rate` units per second on average, with bursts of up to `burst` units. """
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+
+        self.tokens = burst
+        self.last_update = self.clock()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_update) * self.rate)
+        self.last_update = now
+
+    def set_rate(self, rate, burst):
+        # Tokens earned so far count at the old rate
+        self._refill()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = min(self.tokens, burst)
+
+    def try_consume(self, amount=1):
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def time_until_available(self, amount=1):
+        self._refill()
+        return max(0., (min(amount, self.burst) - self.tokens) / self.rate) if self.rate else float('inf')
+
+    async def consume(self, amount=1):
+        # Serialize waiters, so that a big request is not starved by a stream of small ones
+        async with self.lock:
+            while not self.try_consume(min(amount, self.burst)):
+                await asyncio.sleep(self.time_until_available(amount))
+            # Requests larger than the bucket go into debt instead of waiting forever
+            if amount > self.burst:
+                self.tokens -= amount - self.burst
+
+
+class HostRateLimiter:
+    """ Limit the request rate and the concurrent requests to a single host.
+
+    Use as `async with limiter:` around a request session, and `await limiter.throttle()` before every attempt."""
+    def __init__(self, host, requests_per_second, burst, concurrency):
+        self.host = host
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def throttle(self):
+        await self.bucket.consume()
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.semaphore.release()
+
+
+class HostRateLimiterRegistry:
+    def __init__(self, requests_per_second=1., burst=5, concurrency=4):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.concurrency = concurrency
+        self.limiters = {}
+
+    def get(self, url):
+        host = urlparse(url).netloc or url
+        if host not in self.limiters:
+            self.limiters[host] = HostRateLimiter(host, self.requests_per_second, self.burst, self.concurrency)
+        return self.limiters[host]
@@ -0,0 +1,80 @@
+import datetime
+import json
+import logging
+import os
+import re
+import time
+
+
+class SearchCache:
+    """ Persistent cache of parsed search results, keyed by the normalized query.
+
+    Empty results are cached as well, with a shorter TTL if the searched object aired recently,
+    as fresh releases are likely to show up soon, while old holes rarely get filled.
+    The file is replaced atomically, an empty path keeps the cache in memory only."""
+    DEFAULT_PATH = os.path.expanduser('~/.cache/show_downloader/search_cache.json')
+    TTL = {
+        'results': datetime.timedelta(hours=12),
+        'empty_recent': datetime.timedelta(hours=3),
+        'empty_old': datetime.timedelta(days=7),
+    }
+    RECENT = datetime.timedelta(days=14)
+    # Seconds between saves while searching, so that a crash loses little
+    SAVE_INTERVAL = 60
+
+    def __init__(self, path=None, ttl=None, clock=time.time):
+        self.path = self.DEFAULT_PATH if path is None else path
+        self.ttl = dict(self.TTL, **(ttl if ttl else {}))
+        self.clock = clock
+        self.entries = self._load()
+        self.last_save = self.clock()
+
+    @staticmethod
+    def normalize_query(query):
+        return re.sub(r'\s+', ' ', query).strip().lower()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning('Search cache "{}" is unreadable, starting empty: {}'.format(self.path, e))
+            return {}
+
+    def save(self):
+        if not self.path:
+            return
+        now = self.clock()
+        self.last_save = now
+        self.entries = {k: v for k, v in self.entries.items() if v.get('expires', 0) > now}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            logging.warning('Could not save search cache "{}": {}'.format(self.path, e))
+
+    def get(self, query):
+        """ Return the cached result dicts, or None if the query is not cached (anymore) """
+        entry = self.entries.get(self.normalize_query(query))
+        if entry is None or entry.get('expires', 0) <= self.clock():
+            return None
+        return entry.get('results', [])
+
+    def put(self, query, results, aired=None):
+        self.entries[self.normalize_query(query)] = {
+            'results': results,
+            'expires': self.clock() + self.get_ttl(results, aired).total_seconds(),
+        }
+        if self.clock() - self.last_save >= self.SAVE_INTERVAL:
+            self.save()
+
+    def get_ttl(self, results, aired=None):
+        if results:
+            return self.ttl['results']
+        if aired is not None and datetime.date.today() - aired <= self.RECENT:
+            return self.ttl['empty_recent']
+        return self.ttl['empty_old']
@@ -1,58 +1,178 @@
 import asyncio
+import base64
+import binascii
+import datetime
 import logging
+import math
 import re
 
+from a_argument_to_show.release_name import index_by_episode, parse_release_name
 from c_status_to_torrent.piratebay import PiratebayGrabber
 
 
 class Status2Torrent:
-    def __init__(self, quality, event_loop):
+    SEASON_SEARCH_PAGES = 3
+    # Acceptable (min, max) sizes in bytes per reference type, results of unknown size are always accepted
+    SIZE_BOUNDS = {'episode': (50 << 20, 4 << 30), 'season': (500 << 20, 60 << 30)}
+    # Cost of a transfer in bytes-equivalent (upload, cloud wait, cleanup), and the size of an unknown episode
+    TRANSFER_COST = 200 << 20
+    EPISODE_SIZE_ESTIMATE = 500 << 20
+
+    def __init__(self, quality, event_loop, size_bounds=None, grabber_options=None):
         torrenter = GRABBER.get('default')
-        self.torrent_grabber = torrenter(event_loop)
-        self.quality = quality if quality else {}
+        self.torrent_grabber = torrenter(event_loop, **(grabber_options if grabber_options else {}))
+        self.size_bounds = dict(self.SIZE_BOUNDS, **(size_bounds if size_bounds else {}))
+        # An ordered profile of quality tiers, the first tier with results wins
+        self.quality = quality if type(quality) is list else [quality if quality else {}]
+        self._matchers = {}
+        # infohash -> (show, torrent) of the references it satisfies over all shows of the run, the claiming one first
+        self.claims = {}
 
     async def close(self):
         await self.torrent_grabber.close()
 
-    async def get_torrents(self, information):
+    async def iter_torrents(self, information):
+        """ Yield the torrents of the show as their searches finish, so that downloads can start right away.
+
+        One (paginated) search per season, episodes without a match fall back to their own search. A season with one
+        missing episode only searches for that episode. """
         logging.debug('Getting torrents for {} ({} eps)...'.format(information.show.name, len(information.status)))
+        show = information.show
+        episodes_by_season = {season.number: season.get_aired_episodes()
+                              for season in information.status.seasons_missing}
+        for ep in information.status.episodes_missing:
+            episodes_by_season.setdefault(ep.season, []).append(ep)
+        # A single missing episode is found faster by its own search than in the results of its whole season
+        pending = {asyncio.ensure_future(self.get_torrent_for_episode(show, episodes[0]) if len(episodes) == 1 else
+                                         self._search_season(show, show.seasons.get(season_number), episodes))
+                   for season_number, episodes in episodes_by_season.items()}
+
+        found = 0
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if type(result) is tuple:
+                        torrents, unmatched = result
+                        pending |= {asyncio.ensure_future(self.get_torrent_for_episode(show, ep)) for ep in unmatched}
+                    else:
+                        torrents = [result]
+                    for torrent in self._deduplicate(show, [t for t in torrents if t]):
+                        found += len(torrent)
+                        yield torrent
+        finally:
+            # The consumer stopped early
+            [task.cancel() for task in pending]
+        logging.info('Found {} torrents to get "{}" up-to-date'.format(found, show.name))
+
+    def _deduplicate(self, show, torrents):
+        """ Drop links that another reference already claimed, and torrents whose best link is claimed.
+
+        The best link of a torrent claims its infohash. If the best link of a torrent was already claimed,
+        (e.g. by a season pack or a multi-episode release) its reference is satisfied by that transfer.
+        The dropped torrent is kept as a fallback, see get_fallbacks."""
+        deduplicated = []
+        # Season packs first, as they satisfy the most references
+        for torrent in sorted(torrents, key=lambda t: hasattr(t.reference, 'episode')):
+            claims = self.claims.get(torrent.infohashes[0])
+            if claims is not None:
+                logging.info('{} - {} is satisfied by the same torrent as {}'.format(
+                    show.name, torrent.reference, claims[0][1].reference))
+                claims.append((show, torrent))
+                continue
 
-        torrents_ = await self._get_torrents_async(information)
-        torrents = []
-        for torrent in torrents_:
-            if type(torrent) is list:
-                [torrents.append(t) for t in torrent]
-            elif torrent is not None:
-                torrents.append(torrent)
-        logging.info('Found {} torrents to get "{}" up-to-date'.format(sum([len(l) for l in torrents if l]),
-                                                                       information.show.name))
+            torrent.remove_infohashes(self.claims)
+            self.claims[torrent.infohashes[0]] = [(show, torrent)]
+            deduplicated.append(torrent)
+        return deduplicated
 
-        return torrents
+    def get_fallbacks(self, torrent):
+        """ The (show, torrent) that were dropped for the best link of `torrent`, to download once it failed.
 
-    async def _get_torrents_async(self, information):
-        episode_tasks = [asyncio.ensure_future(self.get_torrent_for_episode(information.show, ep))
-                         for ep in information.status.episodes_missing]
-        season_tasks = [asyncio.ensure_future(self.get_torrents_for_season(information.show, se))
-                         for se in information.status.seasons_missing]
+        Links that `torrent` had are removed from them, those failed already. """
+        fallbacks = []
+        for infohash, claims in list(self.claims.items()):
+            if claims[0][1] is not torrent:
+                continue
+            del self.claims[infohash]
+            for show, fallback in claims[1:]:
+                fallback.remove_infohashes(set(torrent.infohashes) | {infohash})
+                if fallback:
+                    fallbacks.append((show, fallback))
+        return fallbacks
 
-        return await asyncio.gather(*episode_tasks, *season_tasks)
+    async def _search_season(self, show, season, episodes=None):
+        """ The torrents found in the season search, and the episodes that need a search of their own.
 
-    async def get_torrents_for_season(self, show, season):
+        A complete season pack is chosen over the episodes if it is cheaper in transferred bytes and transfers. """
         logging.debug('{} - {}: Searching for torrents...'.format(show.name, season))
+        episodes = episodes if episodes is not None else season.get_aired_episodes()
 
-        results = await self.torrent_grabber.search(show, season)
-        filtered_results = self.filter_searches(results, season, show)
+        results = await self._search_paginated(show, season, episodes)
+        packs = [result for result in results
+                 if parse_release_name(result.title).is_season_pack and self._pack_is_complete(result, season)]
+        sorted_packs = self.sort_results(self.filter_searches(packs, season, show), season)
 
-        logging.debug('{} - {}: Found {:2} torrents, {} of those match'.format(show.name, season, len(results),
-                                                                               len(filtered_results)))
+        buckets = index_by_episode(results, key=lambda result: result.title)
+        episode_results = {}
+        for episode in episodes:
+            episode_results[episode.episode] = self.sort_results(
+                self.filter_searches(buckets.get((episode.season, episode.episode), []), episode, show), episode)
 
-        sorted_results = self.sort_results(filtered_results)
-        if sorted_results:
-            return [Torrent(season, sorted_results)]
-        else:
-            # No season found, so search for all singular episodes
-            ret = [asyncio.ensure_future(self.get_torrent_for_episode(show, ep)) for ep in season.episodes]
-            return await asyncio.gather(*ret)
+        logging.debug('{} - {}: Found {:2} torrents, {} season packs and {}/{} episodes match'.format(
+            show.name, season, len(results), len(sorted_packs), len([r for r in episode_results.values() if r]),
+            len(episodes)))
+
+        if sorted_packs and self._pack_is_cheaper(sorted_packs[0], season, episodes, episode_results):
+            return [Torrent(season, sorted_packs)], []
+
+        torrents, unmatched = [], []
+        for episode in episodes:
+            if episode_results[episode.episode]:
+                torrents.append(Torrent(episode, episode_results[episode.episode]))
+            else:
+                unmatched.append(episode)
+
+        logging.debug('{} - {}: {} episodes found in the season results, searching {} separately'.format(
+            show.name, season, len(torrents), len(unmatched)))
+        return torrents, unmatched
+
+    @staticmethod
+    def _pack_is_complete(pack, season):
+        """ A pack can only contain the episodes that aired before it was uploaded, so only a pack of a season that
+        finished airing, uploaded after its last episode, has all of them """
+        aired = season.get_aired_episodes()
+        if not aired or len(aired) < len(season.episodes):
+            return False
+        return pack.uploaded is None or pack.uploaded >= max(episode.date for episode in aired)
+
+    def _pack_is_cheaper(self, pack, season, episodes, episode_results):
+        """ Compare the cost (bytes + a fixed cost per transfer) of the season pack against the missing episodes.
+
+        Sizes that are unknown are estimated from the known episode sizes. """
+        known_sizes = [results[0].size for results in episode_results.values() if results and results[0].size]
+        episode_size = sum(known_sizes) / len(known_sizes) if known_sizes else self.EPISODE_SIZE_ESTIMATE
+
+        episodes_cost = sum((results[0].size if results and results[0].size else episode_size) + self.TRANSFER_COST
+                            for results in episode_results.values())
+        pack_cost = (pack.size if pack.size else episode_size * len(season.get_aired_episodes())) + self.TRANSFER_COST
+
+        logging.debug('{}: season pack costs {:.0f} MiB, {} episodes cost {:.0f} MiB'.format(
+            season, pack_cost / (1 << 20), len(episodes), episodes_cost / (1 << 20)))
+        return pack_cost <= episodes_cost
+
+    async def _search_paginated(self, show, season, episodes):
+        """ Page through the season results until they run out or every episode has results """
+        results = []
+        wanted = {(episode.season, episode.episode) for episode in episodes}
+        for page in range(self.SEASON_SEARCH_PAGES):
+            results_page = await self.torrent_grabber.search(show, season, page=page)
+            results.extend(results_page)
+            if len(results_page) < self.torrent_grabber.RESULTS_PER_PAGE or \
+                    wanted <= index_by_episode(results, key=lambda result: result.title).keys():
+                break
+        return results
 
     async def get_torrent_for_episode(self, show, episode):
         logging.debug('{} - : Searching for torrents...'.format(show.name, episode))
@@ -63,39 +183,143 @@ class Status2Torrent:
         logging.debug('{}: Found {:2} torrents, {} of those match'.format(episode, len(results),
                                                                           len(filtered_results)))
 
-        sorted_results = self.sort_results(filtered_results)
+        sorted_results = self.sort_results(filtered_results, episode)
         if sorted_results:
             return Torrent(episode, sorted_results)
 
-    def _torrent_matches(self, result, type_, show):
-        for filter_re in [re.compile(re.sub(r'\W', '.?', show.name)),
-                          type_.get_regex(),
-                          QUALITY_REGEX['encoder'].get(self.quality.get('encoder')),
-                          QUALITY_REGEX['quality'].get(self.quality.get('quality'))]:
-            if filter_re and not filter_re.search(result.title):
-                return False
-        return True
+    def _get_matcher(self, show, type_):
+        key = (show.name, repr(type_), tuple(tuple(sorted(tier.items())) for tier in self.quality))
+        if key not in self._matchers:
+            self._matchers[key] = TorrentMatcher(show, type_, self.quality)
+        return self._matchers[key]
+
+    def _get_size_bounds(self, type_):
+        return self.size_bounds.get('episode' if hasattr(type_, 'episode') else 'season')
 
     def filter_searches(self, results, type_, show):
-        return [result for result in results if self._torrent_matches(result, type_, show)]
+        low, high = self._get_size_bounds(type_)
+        results = [result for result in results if not result.size or low <= result.size <= high]
+        return self._get_matcher(show, type_).filter(results)
 
-    @staticmethod
-    def sort_results(results):
-        return sorted(results, key=lambda f: f.seeders, reverse=True)
+    def sort_results(self, results, type_=None):
+        """ Rank by a composite of seeders, how cheap the size is within its bounds, and age """
+        bounds = self._get_size_bounds(type_) if type_ is not None else None
+        today = datetime.date.today()
+
+        def score(result):
+            size_fit = .75
+            if bounds and result.size:
+                low, high = bounds
+                # Prefer the smallest acceptable transfer, but not at the expense of availability
+                size_fit = 1 - .5 * min(1, max(0, (result.size - low) / (high - low)))
+            age_fit = .9
+            if result.uploaded:
+                age_fit = 1 - .25 * min(1, (today - result.uploaded).days / (5 * 365))
+            return math.log1p(result.seeders) * size_fit * age_fit
+
+        return sorted(results, key=score, reverse=True)
 
     def __bool__(self):
         return True
 
 
+class TorrentMatcher:
+    """ All filters of a (show, reference, quality profile) precompiled once.
+
+    The reference is compared on the parsed release name, the show name and every quality tier are combined
+    into one pattern per tier. Filtering returns the results of the best tier that has any."""
+    def __init__(self, show, reference, quality):
+        if hasattr(reference, 'episode'):
+            self.season, self.episode = reference.season, reference.episode
+        else:
+            self.season, self.episode = reference.number, None
+
+        show_filter = re.compile(re.sub(r'\W', '.?', show.name))
+        self.tiers = []
+        for tier in quality if type(quality) is list else [quality]:
+            filters = [show_filter,
+                       QUALITY_REGEX['encoder'].get(tier.get('encoder')),
+                       QUALITY_REGEX['quality'].get(tier.get('quality'))]
+            self.tiers.append(re.compile(''.join('(?=.*?{})'.format(self._scope_flags(f.pattern))
+                                                 for f in filters if f)))
+
+    @staticmethod
+    def _scope_flags(pattern):
+        # Global inline flags are only allowed at the start, so turn "(?i)..." into the scoped "(?i:...)"
+        match = re.match(r'\(\?([a-zA-Z]+)\)', pattern)
+        if match:
+            return '(?{}:{})'.format(match.group(1), pattern[match.end():])
+        return '(?:{})'.format(pattern)
+
+    def _reference_matches(self, title):
+        release = parse_release_name(title)
+        if self.episode is None:
+            return self.season in release.seasons
+        return release.season == self.season and self.episode in release.episodes
+
+    def tier(self, result, limit=None):
+        """ Index of the best quality tier the result matches, None if it matches none of the first `limit` tiers """
+        for i, regex in enumerate(self.tiers[:limit]):
+            if regex.match(result.title) is not None:
+                return i if self._reference_matches(result.title) else None
+
+    def filter(self, results):
+        """ Results of the best tier any of the results match, in a single pass """
+        best_tier, best_results = len(self.tiers), []
+        for result in results:
+            # Worse tiers than the best so far are not tried
+            tier = self.tier(result, best_tier + 1)
+            if tier is None:
+                continue
+            if tier < best_tier:
+                best_tier, best_results = tier, []
+            best_results.append(result)
+        return best_results
+
+
 class Torrent:
     def __init__(self, reference, results):
         self.reference = reference
-        self.links = [t.magnet for t in results]
+        self.links, self.infohashes = [], []
+        for result in results:
+            infohash = get_infohash(result.magnet)
+            if infohash not in self.infohashes:
+                self.links.append(result.magnet)
+                self.infohashes.append(infohash)
+
+    @classmethod
+    def from_links(cls, reference, links):
+        torrent = cls(reference, [])
+        torrent.links, torrent.infohashes = list(links), [get_infohash(link) for link in links]
+        return torrent
+
+    def prefer(self, infohashes):
+        """ Move the links with these infohashes to the front, keeping the ranking otherwise """
+        ranked = sorted(zip(self.links, self.infohashes), key=lambda link: link[1] not in infohashes)
+        self.links, self.infohashes = [r[0] for r in ranked], [r[1] for r in ranked]
+
+    def remove_infohashes(self, infohashes):
+        kept = [(link, infohash) for link, infohash in zip(self.links, self.infohashes) if infohash not in infohashes]
+        self.links, self.infohashes = [k[0] for k in kept], [k[1] for k in kept]
 
     def __len__(self):
         return len(self.links)
 
 
+def get_infohash(magnet):
+    """ Canonicalize a magnet link to its lowercase hex infohash, or the link itself if it has none """
+    match = re.search(r'(?i)xt=urn:btih:([0-9a-f]{40}|[a-z2-7]{32})(?![0-9a-z])', magnet)
+    if match is None:
+        return magnet
+    infohash = match.group(1)
+    if len(infohash) == 32:
+        try:
+            return binascii.hexlify(base64.b32decode(infohash.upper())).decode()
+        except binascii.Error:
+            return magnet
+    return infohash.lower()
+
+
 GRABBER = {'piratebay': PiratebayGrabber, 'default': PiratebayGrabber}
 
 
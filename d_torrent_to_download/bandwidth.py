@@ -0,0 +1,62 @@
+import datetime
+import re
+import time
+
+from c_status_to_torrent.rate_limiter import TokenBucket
+from d_torrent_to_download.disk_space import parse_size
+
+
+def parse_rate(string):
+    """ Bytes per second of "500K", "2M/s" or "1.5G". 0 is unlimited. """
+    string = string.strip()
+    return parse_size(string[:-2] if string.lower().endswith('/s') else string)
+
+
+def parse_schedule_entry(string):
+    """ "9-18:2M" limits to 2 MiB/s from 9:00 to 18:00. "22-6:0" is unlimited over night. """
+    match = re.match(r'(\d{1,2})-(\d{1,2}):(.+)$', string.strip())
+    if match is None:
+        raise ValueError('Not a schedule entry: {}'.format(string))
+    return int(match.group(1)), int(match.group(2)), parse_rate(match.group(3))
+
+
+def parse_schedule(string):
+    """ Comma-separated schedule entries, like "9-18:2M,22-6:0" """
+    return [parse_schedule_entry(entry) for entry in string.split(',')]
+
+
+class BandwidthLimiter:
+    """ Limit the download bandwidth, in total and per download, with token buckets.
+
+    The total rate can follow a schedule of (start hour, end hour, rate), the first matching entry wins. A rate of 0 or
+    None is unlimited."""
+
+    def __init__(self, rate=None, per_download=None, schedule=(), clock=time.monotonic, now=datetime.datetime.now):
+        self.rate = rate
+        self.per_download = per_download
+        self.schedule = list(schedule)
+        self.now = now
+
+        self.bucket = TokenBucket(rate or 1, rate or 1, clock=clock)
+        self.clock = clock
+
+    def get_rate(self):
+        hour = self.now().hour
+        for start, end, rate in self.schedule:
+            # An entry like 22-6 wraps around midnight
+            if (start <= hour < end) if start <= end else (hour >= start or hour < end):
+                return rate
+        return self.rate
+
+    def get_download_bucket(self):
+        if self.per_download:
+            return TokenBucket(self.per_download, self.per_download, clock=self.clock)
+
+    async def throttle(self, amount, download_bucket=None):
+        if download_bucket is not None:
+            await download_bucket.consume(amount)
+        rate = self.get_rate()
+        if rate:
+            if rate != self.bucket.rate:
+                self.bucket.set_rate(rate, rate)
+            await self.bucket.consume(amount)
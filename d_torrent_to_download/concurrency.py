@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+
+
+class AdaptiveConcurrency:
+    """ Adjust the limit of the file download scheduler to the observed throughput and error rate (AIMD).
+
+    Every interval the limit grows additively while all slots are busy and nothing got worse. When the error rate is too
+    high or the throughput dropped, the limit is cut by the decrease factor. It always stays within min/max.
+    The scheduler must only hand out slots for the downloads that report their bytes and results, a slot waiting for
+    something else would look like a slow download. Windows are closed by start(), also when no bytes arrive."""
+
+    def __init__(self, scheduler, minimum=2, maximum=30, interval=10, increase=1, decrease=.5, max_error_rate=.1,
+                 throughput_drop=.2, clock=time.monotonic):
+        self.scheduler = scheduler
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = interval
+        self.increase = increase
+        self.decrease = decrease
+        self.max_error_rate = max_error_rate
+        self.throughput_drop = throughput_drop
+        self.clock = clock
+
+        self.scheduler.limit = min(max(self.scheduler.limit, minimum), maximum)
+        self.throughput = None
+        self._reset(self.clock())
+        self.task = None
+
+    def _reset(self, now):
+        self.window_start = now
+        self.bytes = 0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def limit(self):
+        return self.scheduler.limit
+
+    def record_bytes(self, amount):
+        self.bytes += amount
+
+    def record_result(self, success):
+        self.requests += 1
+        self.errors += not success
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.update()
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def update(self, now=None):
+        now = self.clock() if now is None else now
+        throughput = self.bytes / max(now - self.window_start, 1e-9)
+        error_rate = self.errors / self.requests if self.requests else 0.
+
+        limit = self.scheduler.limit
+        # With idle slots a lower throughput means less work, not congestion, and another slot would not help
+        saturated = self.scheduler.active >= limit
+        if error_rate > self.max_error_rate or \
+                (saturated and self.throughput and throughput < self.throughput * (1 - self.throughput_drop)):
+            limit = max(self.minimum, int(limit * self.decrease))
+        elif saturated:
+            limit = min(self.maximum, limit + self.increase)
+
+        if limit != self.scheduler.limit:
+            logging.debug('Download concurrency {} -> {} ({:.1f} MB/s, {:.0%} errors)'.format(
+                self.scheduler.limit, limit, throughput / 1e6, error_rate))
+            self.scheduler.limit = limit
+        self.throughput = throughput
+        self._reset(now)
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import os
+import re
+import shutil
+
+UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(string):
+    """ Bytes of "4096", "500M", "1.5G" or "2T" """
+    match = re.match(r'(?i)(\d+(?:\.\d+)?)([KMGT]?)(?:i?B)?$', string.strip())
+    if match is None:
+        raise ValueError('Not a size: {}'.format(string))
+    return int(float(match.group(1)) * UNITS[match.group(2).upper()])
+
+
+class NotEnoughDiskSpace(Exception):
+    """ The file does not fit on its filesystem even without other downloads. Another link would not fit either. """
+
+
+class DiskSpaceAdmission:
+    """ Reserve the size of a file against the free space of its filesystem before downloading it.
+
+    A file that does not fit next to the running downloads waits until they are done. One that does not fit even
+    on an otherwise idle filesystem is refused with NotEnoughDiskSpace, it is left for a later run."""
+
+    def __init__(self, margin=1 << 30, disk_usage=shutil.disk_usage):
+        self.margin = margin
+        self.disk_usage = disk_usage
+
+        self.reserved = {}
+        self.condition = asyncio.Condition()
+
+    @staticmethod
+    def _get_existing(path):
+        path = os.path.abspath(path)
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return path
+
+    def _get_device(self, path):
+        return os.stat(self._get_existing(path)).st_dev
+
+    def get_available(self, path):
+        free = self.disk_usage(self._get_existing(path)).free
+        return free - self.margin - self.reserved.get(self._get_device(path), 0)
+
+    async def reserve(self, path, size):
+        """ True once `size` bytes are reserved for `path`, raises NotEnoughDiskSpace if they will never fit """
+        device = self._get_device(path)
+        async with self.condition:
+            while size > self.get_available(path):
+                if not self.reserved.get(device):
+                    raise NotEnoughDiskSpace('Not enough disk space for {} ({:.1f} GB)'.format(
+                        os.path.basename(path), size / 1e9))
+                logging.info('Deferring {} until there is disk space for it'.format(os.path.basename(path)))
+                await self.condition.wait()
+            self.reserved[device] = self.reserved.get(device, 0) + size
+            return True
+
+    async def release(self, path, size):
+        async with self.condition:
+            device = self._get_device(path)
+            self.reserved[device] -= size
+            self.condition.notify_all()
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+
+
+class DownloaderPool:
+    """ Several accounts of a downloader behind the interface of a single one.
+
+    New transfers go to the account with the fewest active transfers, ties broken by the most remaining quota.
+    Accounts whose quota is used up get no new transfers. Every transfer and file returned is tagged with the index of
+    its account, so that all later calls for it are routed there."""
+    QUOTA_REFRESH = 5 * 60
+
+    def __init__(self, downloaders, clock=time.monotonic):
+        self.accounts = list(downloaders)
+        self.downloaders = [d for d in downloaders if d]
+        if len(self.downloaders) < len(downloaders):
+            logging.warning('{} of {} accounts could not be used'.format(len(downloaders) - len(self.downloaders),
+                                                                        len(downloaders)))
+        self.clock = clock
+
+        self.active = [set() for _ in self.downloaders]
+        self.quota = [None for _ in self.downloaders]
+        self.last_quota_refresh = None
+
+    @classmethod
+    def from_logins(cls, downloader_class, logins, event_loop):
+        return cls([downloader_class(login, event_loop) for login in logins])
+
+    @staticmethod
+    def _tag(item, account):
+        if item is not None:
+            item.account = account
+        return item
+
+    def _get_owner(self, item):
+        return self.downloaders[getattr(item, 'account', 0)]
+
+    async def _refresh_quota(self):
+        if self.last_quota_refresh is not None and self.clock() - self.last_quota_refresh < self.QUOTA_REFRESH:
+            return
+        self.last_quota_refresh = self.clock()
+
+        async def get_quota(downloader):
+            try:
+                return await downloader.get_quota() if hasattr(downloader, 'get_quota') else None
+            except Exception as e:
+                logging.warning('Could not get the quota of an account: {}'.format(repr(e)))
+
+        self.quota = await asyncio.gather(*[get_quota(d) for d in self.downloaders])
+
+    def get_upload_order(self):
+        """ Indices of the accounts with quota left, best first. An unknown quota counts as unlimited. """
+        quota = [float('inf') if q is None else q for q in self.quota]
+        usable = [i for i in range(len(self.downloaders)) if quota[i] > 0]
+        return sorted(usable, key=lambda i: (len(self.active[i]), -quota[i]))
+
+    async def upload(self, link):
+        await self._refresh_quota()
+        for account in self.get_upload_order():
+            transfer = await self.downloaders[account].upload(link)
+            if transfer:
+                self.active[account].add(str(transfer.id))
+                return self._tag(transfer, account)
+        logging.error('No account could take {}'.format(link[:60]))
+
+    async def get_transfer(self, transfer):
+        return self._tag(await self._get_owner(transfer).get_transfer(transfer), getattr(transfer, 'account', 0))
+
+    async def get_transfers(self):
+        transfers = []
+        for account, account_transfers in enumerate(await asyncio.gather(*[d.get_transfers()
+                                                                           for d in self.downloaders])):
+            account_transfers = account_transfers or []
+            self.active[account] = {str(t.id) for t in account_transfers if getattr(t, 'progress', 0) < 1}
+            transfers.extend(self._tag(t, account) for t in account_transfers)
+        return transfers
+
+    def is_transfer_finished(self, transfer, start_time):
+        return self._get_owner(transfer).is_transfer_finished(transfer, start_time)
+
+    async def check_cache(self, infohashes):
+        # The cache belongs to the service, not to an account
+        for downloader in self.downloaders:
+            if hasattr(downloader, 'check_cache'):
+                return await downloader.check_cache(infohashes)
+        return []
+
+    async def get_file_from_transfer(self, transfer):
+        return self._tag(await self._get_owner(transfer).get_file_from_transfer(transfer),
+                         getattr(transfer, 'account', 0))
+
+    async def get_files_from_transfer(self, transfer):
+        """ None if the account can not list the files of a transfer """
+        owner = self._get_owner(transfer)
+        if not hasattr(owner, 'get_files_from_transfer'):
+            return
+        files = await owner.get_files_from_transfer(transfer)
+        return [self._tag(file_, getattr(transfer, 'account', 0)) for file_ in files] if files else files
+
+    async def download_transfer(self, transfer, download_directory):
+        return await self._get_owner(transfer).download_transfer(transfer, download_directory)
+
+    async def download_file(self, file_, download_directory):
+        return await self._get_owner(file_).download_file(file_, download_directory)
+
+    async def delete(self, transfer):
+        account = getattr(transfer, 'account', 0)
+        self.active[account].discard(str(transfer.id))
+        return await self.downloaders[account].delete(transfer)
+
+    async def close(self):
+        await asyncio.gather(*[d.close() for d in self.accounts])
+
+    def __bool__(self):
+        return bool(self.downloaders)
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+
+
+class JobJournal:
+    """ Persistent state of every reference being downloaded, so a restarted run resumes instead of starting over.
+
+    searched: the links are known. uploaded: a transfer exists. downloading: files are being written. done.
+    failed: all links failed, the reference is searched again in the next run instead of being resumed."""
+    SEARCHED, UPLOADED, DOWNLOADING, DONE, FAILED = 'searched', 'uploaded', 'downloading', 'done', 'failed'
+    DEFAULT_PATH = os.path.expanduser('~/.cache/show_downloader/journal.sqlite')
+
+    def __init__(self, path=None):
+        self.path = self.DEFAULT_PATH if path is None else path
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS jobs (show TEXT, reference TEXT, state TEXT, '
+                                    'links TEXT, transfer_id TEXT, path TEXT, bytes_written INTEGER DEFAULT 0, '
+                                    'updated REAL, PRIMARY KEY (show, reference))')
+            # Hashes of the downloaded files, to check their integrity later without trusting the file system
+            self.connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, show TEXT, '
+                                    'reference TEXT, algorithm TEXT, digest TEXT, updated REAL)')
+
+    @staticmethod
+    def _get_keys(show, reference):
+        return show.get_storage_name(), repr(reference)
+
+    def _update(self, show, reference, **values):
+        values['updated'] = time.time()
+        show_key, reference_key = self._get_keys(show, reference)
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO jobs (show, reference) VALUES (?, ?)',
+                                    (show_key, reference_key))
+            self.connection.execute('UPDATE jobs SET {} WHERE show = ? AND reference = ?'.format(
+                ', '.join('{} = ?'.format(column) for column in values)),
+                list(values.values()) + [show_key, reference_key])
+
+    def get(self, show, reference):
+        row = self.connection.execute('SELECT * FROM jobs WHERE show = ? AND reference = ?',
+                                      self._get_keys(show, reference)).fetchone()
+        return dict(row) if row else None
+
+    def get_pending(self, show):
+        """ Jobs of the show that were started, but neither finished nor failed """
+        return [dict(row) for row in self.connection.execute(
+            'SELECT * FROM jobs WHERE show = ? AND state NOT IN (?, ?)',
+            (show.get_storage_name(), self.DONE, self.FAILED))]
+
+    def record_searched(self, show, torrent):
+        job = self.get(show, torrent.reference)
+        if job is None or job['state'] in (self.DONE, self.FAILED):
+            self._update(show, torrent.reference, state=self.SEARCHED, links=json.dumps(torrent.links),
+                         transfer_id=None, path=None, bytes_written=0)
+
+    def record_uploaded(self, show, reference, transfer):
+        self._update(show, reference, state=self.UPLOADED, transfer_id=str(transfer.id))
+
+    def record_downloading(self, show, reference, path, bytes_written=0):
+        self._update(show, reference, state=self.DOWNLOADING, path=path, bytes_written=bytes_written)
+
+    def record_done(self, show, reference):
+        logging.debug('{} - {} is done'.format(show.name, reference))
+        self._update(show, reference, state=self.DONE)
+
+    def record_failed(self, show, reference):
+        logging.debug('{} - {} failed'.format(show.name, reference))
+        self._update(show, reference, state=self.FAILED)
+
+    def record_file_hash(self, show, reference, path, algorithm, digest):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                                    (os.path.abspath(path),) + self._get_keys(show, reference) +
+                                    (algorithm, digest, time.time()))
+
+    def get_file_hash(self, path):
+        """ (algorithm, digest) of a downloaded file, or None """
+        row = self.connection.execute('SELECT algorithm, digest FROM files WHERE path = ?',
+                                      (os.path.abspath(path),)).fetchone()
+        return tuple(row) if row else None
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import os
+
+import aiohttp
+
+from premiumize_me_dl.premiumize_me_api import PremiumizeMeAPI
+
+
+class PremiumizeMe(PremiumizeMeAPI):
+    """ The premiumize.me downloader, with the cache check and account quota of the service that premiumize_me_dl
+    does not offer.
+
+    A cached torrent is finished as soon as it is uploaded. Login is "customer_id:pin" or a file containing it."""
+    CACHE_CHECK_URL = 'https://www.premiumize.me/api/cache/check'
+    ACCOUNT_INFO_URL = 'https://www.premiumize.me/api/account/info'
+
+    def __init__(self, login, event_loop, timeout=30):
+        super().__init__(login, event_loop)
+        self.api_credentials = self._parse_login(login)
+        self.api_timeout = timeout
+        self.api_session = None
+
+    @staticmethod
+    def _parse_login(login):
+        if login and os.path.isfile(login):
+            with open(login) as f:
+                login = f.read().strip()
+        customer_id, _, pin = (login or '').partition(':')
+        return {'customer_id': customer_id, 'pin': pin}
+
+    async def _request(self, url, params=()):
+        """ The response of a successful call, else None """
+        if self.api_session is None:
+            self.api_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.api_timeout))
+        try:
+            async with self.api_session.get(url, params=list(self.api_credentials.items()) + list(params)) as r_:
+                response = await r_.json(content_type=None)
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+            logging.warning('Request to {} failed: {}'.format(url, repr(e)))
+            return
+        if not isinstance(response, dict) or response.get('status') != 'success':
+            logging.warning('Request to {} failed: {}'.format(
+                url, response.get('message') if isinstance(response, dict) else response))
+            return
+        return response
+
+    async def check_cache(self, infohashes):
+        """ The infohashes that are cached, none if the check fails """
+        if not infohashes:
+            return []
+        response = await self._request(self.CACHE_CHECK_URL, [('items[]', infohash) for infohash in infohashes])
+        if response is None:
+            return []
+        return [infohash for infohash, cached in zip(infohashes, response.get('response', [])) if cached]
+
+    async def get_quota(self):
+        """ The share of the fair use limit left, between 0 and 1. None if unknown. """
+        response = await self._request(self.ACCOUNT_INFO_URL)
+        if response is None or response.get('limit_used') is None:
+            return
+        return max(0., 1. - float(response['limit_used']))
+
+    async def close(self):
+        await super().close()
+        if self.api_session is not None:
+            await self.api_session.close()
@@ -0,0 +1,93 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+
+
+class DownloadScheduler:
+    """ Hand out download slots by priority, with a global limit and a cap per show.
+
+    Newly aired episodes go first, then recent holes, then old backfill. Within a priority, first come first served.
+    A show at its cap does not block the waiters of other shows behind it."""
+    NEW, RECENT, BACKFILL = 0, 1, 2
+
+    def __init__(self, limit=15, per_show=5, new_days=7, recent_days=90):
+        self._limit = limit
+        self.per_show = per_show
+        self.new_days = new_days
+        self.recent_days = recent_days
+
+        self.active = 0
+        self.active_per_show = {}
+        self.waiting = []
+        self.counter = itertools.count()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @limit.setter
+    def limit(self, limit):
+        self._limit = limit
+        self._dispatch()
+
+    def get_priority(self, reference):
+        if hasattr(reference, 'date'):
+            aired = reference.date
+        else:
+            aired = max([ep.date for ep in getattr(reference, 'episodes', []) if ep.date], default=None)
+        if aired is None:
+            return self.BACKFILL
+        age = (datetime.date.today() - aired).days
+        if age <= self.new_days:
+            return self.NEW
+        return self.RECENT if age <= self.recent_days else self.BACKFILL
+
+    def _dispatch(self):
+        deferred = []
+        while self.waiting and self.active < self._limit:
+            entry = heapq.heappop(self.waiting)
+            priority, _, show, future = entry
+            if future.done():
+                continue
+            if self.active_per_show.get(show, 0) >= self.per_show:
+                deferred.append(entry)
+                continue
+            self.active += 1
+            self.active_per_show[show] = self.active_per_show.get(show, 0) + 1
+            future.set_result(None)
+        for entry in deferred:
+            heapq.heappush(self.waiting, entry)
+
+    async def acquire(self, show, reference):
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiting, (self.get_priority(reference), next(self.counter), show, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted right before the cancellation, give the slot back
+            if future.done() and not future.cancelled():
+                self.release(show)
+            raise
+
+    def release(self, show):
+        self.active -= 1
+        self.active_per_show[show] -= 1
+        self._dispatch()
+
+    def slot(self, show, reference):
+        return _Slot(self, show, reference)
+
+
+class _Slot:
+    def __init__(self, scheduler, show, reference):
+        self.scheduler = scheduler
+        self.show = show
+        self.reference = reference
+
+    async def __aenter__(self):
+        await self.scheduler.acquire(self.show, self.reference)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.scheduler.release(self.show)
@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+
+def get_digest(piece_digests):
+    """ The file hash: sha256 over the sha256 of every piece, in order """
+    return hashlib.sha256(b''.join(bytes.fromhex(digest) for digest in piece_digests)).hexdigest()
+
+
+def hash_file(path, piece_size):
+    """ The same hash as a download computes on the fly, read back from the disk to check a file is intact """
+    piece_digests = []
+    with open(path, 'rb') as f:
+        for piece in iter(lambda: f.read(piece_size), b''):
+            piece_digests.append(hashlib.sha256(piece).hexdigest())
+    return get_digest(piece_digests)
+
+
+class SegmentedDownloader:
+    """ Download a file over HTTP in parallel Range segments into a ".part" file.
+
+    The progress of every segment is kept in a ".part.json" next to it, so an interrupted download resumes
+    where it stopped. The data is hashed in pieces while it is written, segments start on piece boundaries and the
+    digests of finished pieces are kept in the state, so a resume only reads back the last unfinished piece.
+    The ".part" is synced and only renamed to its final name once every byte was received and a digest exists for
+    every piece. The source offers no hash to compare with, so this proves completeness, not integrity: the digest
+    is handed to on_hash to be recorded. When the file is downloaded again, a file that still has the recorded digest
+    is intact and kept instead.
+
+    Files are preallocated and written in large buffers by one writer thread per disk, so that the disk sees few,
+    long, sequential writes instead of a thread hop per network chunk."""
+    PART_SUFFIX = '.part'
+    STATE_SUFFIX = '.part.json'
+    HASH_NAME = 'sha256-pieces'
+
+    def __init__(self, event_loop, segments=4, chunk_size=1 << 20, min_segment_size=32 << 20, retries=3,
+                 save_state_every=16 << 20, monitor=None, bandwidth=None, admission=None, piece_size=16 << 20,
+                 write_buffer=8 << 20):
+        self.event_loop = event_loop
+        self.segments = max(1, segments)
+        self.chunk_size = chunk_size
+        self.min_segment_size = min_segment_size
+        self.retries = retries
+        self.save_state_every = save_state_every
+        # Told about every chunk and request result, see AdaptiveConcurrency
+        self.monitor = monitor
+        self.bandwidth = bandwidth
+        self.admission = admission
+        self.piece_size = piece_size
+        self.write_buffer = write_buffer
+
+        self.aiohttp_session = None
+        self.writers = {}
+
+    async def close(self):
+        if self.aiohttp_session is not None:
+            await self.aiohttp_session.close()
+        # Waits for the last writes without blocking the event loop
+        for writer in self.writers.values():
+            await self.event_loop.run_in_executor(None, writer.shutdown)
+        self.writers = {}
+
+    def _get_writer(self, path):
+        device = os.stat(os.path.dirname(os.path.abspath(path))).st_dev
+        if device not in self.writers:
+            self.writers[device] = ThreadPoolExecutor(max_workers=1)
+        return self.writers[device]
+
+    @staticmethod
+    def _preallocate(path, size):
+        """ Reserve all blocks of the file up front, it is written in parallel at several offsets.
+        False if the file is sparse instead. """
+        with open(path, 'wb') as f:
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return True
+            except (AttributeError, OSError):
+                # Not on every OS and file system, a sparse file works as well
+                f.truncate(size)
+                return False
+
+    @staticmethod
+    def _get_allocated(path):
+        """ Bytes the file takes on the disk """
+        try:
+            return os.stat(path).st_blocks * 512
+        except (AttributeError, OSError):
+            return 0
+
+    def _get_session(self):
+        if self.aiohttp_session is None:
+            self.aiohttp_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=60))
+        return self.aiohttp_session
+
+    async def _get_remote_size(self, url):
+        """ Size of the remote file and whether the server supports Range requests """
+        try:
+            async with self._get_session().head(url, allow_redirects=True) as r_:
+                if r_.status == 200 and r_.content_length:
+                    return r_.content_length, r_.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            logging.debug('HEAD request to {} failed: {}'.format(url[:50], repr(e)))
+        return None, False
+
+    def _plan_segments(self, size, ranges_supported):
+        count = min(self.segments, max(1, size // self.min_segment_size)) if ranges_supported else 1
+        bounds = sorted({size * i // count // self.piece_size * self.piece_size for i in range(count)} | {size})
+        return [[bounds[i], bounds[i + 1], 0] for i in range(len(bounds) - 1)]
+
+    def _load_state(self, path, size):
+        try:
+            with open(path + self.STATE_SUFFIX) as f:
+                state = json.load(f)
+            if state.get('size') == size and state.get('piece_size') == self.piece_size and \
+                    os.path.exists(path + self.PART_SUFFIX):
+                return state
+        except (OSError, ValueError):
+            pass
+
+    def _save_state(self, path, state, on_progress=None):
+        if on_progress is not None:
+            on_progress(sum(segment[2] for segment in state['segments']))
+        with open(path + self.STATE_SUFFIX + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(path + self.STATE_SUFFIX + '.tmp', path + self.STATE_SUFFIX)
+
+    async def download(self, url, path, size=None, on_progress=None, on_hash=None, known_hash=None):
+        """ on_progress is called with the bytes written so far, whenever the state is saved.
+        on_hash is called with the digest of the complete file, before it is renamed.
+        known_hash is the digest an earlier download of the file recorded. """
+        if known_hash is not None and os.path.exists(path):
+            digest = await self.event_loop.run_in_executor(self._get_writer(path), hash_file, path, self.piece_size)
+            if digest == known_hash:
+                logging.info('{} is intact, not downloading it again'.format(os.path.basename(path)))
+                return True
+            logging.warning('{} changed since it was downloaded, downloading it again'.format(os.path.basename(path)))
+
+        remote_size, ranges_supported = await self._get_remote_size(url)
+        size = remote_size if remote_size else size
+        if not size:
+            logging.error('Size of {} is unknown, cannot download it segmented'.format(os.path.basename(path)))
+            return False
+
+        state = self._load_state(path, size) if ranges_supported else None
+        # Only the blocks that are not allocated yet take free space, a preallocated file has taken all of them
+        reserved = size - self._get_allocated(path + self.PART_SUFFIX) if state is not None else size
+        if self.admission is not None and reserved > 0:
+            await self.admission.reserve(path, reserved)
+        try:
+            if state is not None:
+                done = sum(segment[2] for segment in state['segments'])
+                logging.info('Resuming {} at {:.0f}%'.format(os.path.basename(path), 100 * done / size))
+            else:
+                state = {'size': size, 'piece_size': self.piece_size, 'pieces': {},
+                         'segments': self._plan_segments(size, ranges_supported)}
+                preallocated = await self.event_loop.run_in_executor(self._get_writer(path), self._preallocate,
+                                                                     path + self.PART_SUFFIX, size)
+                if preallocated and self.admission is not None and reserved > 0:
+                    await self.admission.release(path, reserved)
+                    reserved = 0
+            return await self._download(url, path, size, state, ranges_supported, on_progress, on_hash)
+        finally:
+            if self.admission is not None and reserved > 0:
+                await self.admission.release(path, reserved)
+
+    async def _download(self, url, path, size, state, ranges_supported, on_progress, on_hash):
+        self._save_state(path, state, on_progress)
+
+        fd = os.open(path + self.PART_SUFFIX, os.O_RDWR)
+        writer = self._get_writer(path)
+        bucket = self.bandwidth.get_download_bucket() if self.bandwidth is not None else None
+        done_before, start_time = sum(segment[2] for segment in state['segments']), self.event_loop.time()
+        try:
+            results = await asyncio.gather(*[self._download_segment(url, path, fd, writer, state, segment,
+                                                                    ranges_supported, on_progress, bucket)
+                                             for segment in state['segments']])
+            if all(results):
+                await self.event_loop.run_in_executor(writer, os.fsync, fd)
+        finally:
+            os.close(fd)
+            self._save_state(path, state, on_progress)
+
+        if not all(results):
+            return False
+        duration = max(self.event_loop.time() - start_time, 1e-3)
+        logging.info('Downloaded {} ({:.0f} MB in {:.0f}s, {:.1f} MB/s)'.format(
+            os.path.basename(path), (size - done_before) / 1e6, duration, (size - done_before) / 1e6 / duration))
+        pieces = [state['pieces'].get(str(i)) for i in range((size + self.piece_size - 1) // self.piece_size)]
+        digest = get_digest(pieces) if all(pieces) else None
+        # The ".part" has its full length from the start, the counters and the piece digests tell what was actually
+        # received and written
+        if sum(segment[2] for segment in state['segments']) != size or digest is None:
+            logging.error('{} is incomplete after downloading, discarding it'.format(os.path.basename(path)))
+            os.remove(path + self.PART_SUFFIX)
+            os.remove(path + self.STATE_SUFFIX)
+            return False
+
+        if on_hash is not None:
+            on_hash(digest)
+        os.replace(path + self.PART_SUFFIX, path)
+        os.remove(path + self.STATE_SUFFIX)
+        self._sync_directory(os.path.dirname(path))
+        return True
+
+    @staticmethod
+    def _sync_directory(directory):
+        # Make the rename itself durable
+        try:
+            fd = os.open(directory or '.', os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _resume_hasher(self, fd, position):
+        """ Hash of the unfinished piece up to position, read back from what is already written """
+        piece_start = position // self.piece_size * self.piece_size
+        hasher = hashlib.sha256()
+        if position > piece_start:
+            hasher.update(os.pread(fd, position - piece_start, piece_start))
+        return hasher
+
+    def _write(self, fd, hasher, chunk, position, size):
+        """ Write the chunk and hash it on the way. Runs in the executor, returns the pieces it finished. """
+        os.pwrite(fd, chunk, position)
+        finished = {}
+        chunk = memoryview(chunk)
+        while chunk:
+            piece_end = min(size, (position // self.piece_size + 1) * self.piece_size)
+            part = chunk[:piece_end - position]
+            hasher.update(part)
+            position += len(part)
+            chunk = chunk[len(part):]
+            if position == piece_end:
+                finished[str((position - 1) // self.piece_size)] = hasher.hexdigest()
+                hasher = hashlib.sha256()
+        return hasher, finished
+
+    async def _flush(self, fd, writer, state, segment, hasher, buffer):
+        """ Write the buffered data of the segment, only written bytes count as downloaded in the state """
+        if not buffer:
+            return hasher
+        hasher, finished = await self.event_loop.run_in_executor(
+            writer, self._write, fd, hasher, bytes(buffer), segment[0] + segment[2], state['size'])
+        state['pieces'].update(finished)
+        segment[2] += len(buffer)
+        del buffer[:]
+        return hasher
+
+    async def _download_segment(self, url, path, fd, writer, state, segment, ranges_supported, on_progress,
+                                bucket=None):
+        start, end = segment[0], segment[1]
+        for retry in range(self.retries):
+            if segment[2] >= end - start:
+                return True
+            if not ranges_supported:
+                segment[2] = 0
+            headers = {'Range': 'bytes={}-{}'.format(start + segment[2], end - 1)} if ranges_supported else {}
+            unsaved = 0
+            buffer = bytearray()
+            try:
+                hasher = await self.event_loop.run_in_executor(writer, self._resume_hasher, fd, start + segment[2])
+                async with self._get_session().get(url, headers=headers) as r_:
+                    # A server ignoring the Range answers 200 with the whole file
+                    if r_.status != (206 if headers else 200):
+                        logging.warning('Segment of {} returned status {}'.format(os.path.basename(path), r_.status))
+                        self._record_result(False)
+                        continue
+                    async for chunk in r_.content.iter_chunked(self.chunk_size):
+                        chunk = chunk[:end - start - segment[2] - len(buffer)]
+                        if self.bandwidth is not None:
+                            await self.bandwidth.throttle(len(chunk), bucket)
+                        buffer += chunk
+                        if self.monitor is not None:
+                            self.monitor.record_bytes(len(chunk))
+                        if len(buffer) >= self.write_buffer or segment[2] + len(buffer) >= end - start:
+                            unsaved += len(buffer)
+                            hasher = await self._flush(fd, writer, state, segment, hasher, buffer)
+                        if unsaved >= self.save_state_every:
+                            self._save_state(path, state, on_progress)
+                            unsaved = 0
+                        if segment[2] >= end - start:
+                            break
+                    await self._flush(fd, writer, state, segment, hasher, buffer)
+                self._record_result(segment[2] >= end - start)
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                logging.debug('Segment of {} failed: {}'.format(os.path.basename(path), repr(e)))
+                # Keep what was received before the error
+                await self._flush(fd, writer, state, segment, hasher, buffer)
+                self._record_result(False)
+                await asyncio.sleep(1)
+            except OSError as e:
+                # e.g. the disk is full, retrying does not help
+                logging.error('Could not write {}: {}'.format(os.path.basename(path), repr(e)))
+                return False
+        return segment[2] >= end - start
+
+    def _record_result(self, success):
+        if self.monitor is not None:
+            self.monitor.record_result(success)
@@ -1,3 +1,4 @@
+import copy
 import datetime
 import asyncio
 import logging
@@ -5,45 +6,217 @@ import os
 import re
 
 from a_argument_to_show.thetvdb_api import Episode
-from premiumize_me_dl.premiumize_me_api import PremiumizeMeAPI
-DOWNLOADERS = {'premiumize.me': PremiumizeMeAPI, 'default': PremiumizeMeAPI}
-
-
-class Download:
-    def __init__(self, information, reference, transfer, downloader):
-        self.information = information
-        self.reference = reference
-        self.downloader = downloader
-
-        self.transfer = transfer
-        self.start_time = None
-
-        self.retries = 10
+from d_torrent_to_download.concurrency import AdaptiveConcurrency
+from d_torrent_to_download.disk_space import DiskSpaceAdmission, NotEnoughDiskSpace
+from d_torrent_to_download.downloader_pool import DownloaderPool
+from d_torrent_to_download.premiumize import PremiumizeMe
+from d_torrent_to_download.scheduler import DownloadScheduler
+from d_torrent_to_download.segmented_download import SegmentedDownloader
+from d_torrent_to_download.transfer_poller import TransferPoller
+from d_torrent_to_download.transfer_registry import TransferRegistry
+from d_torrent_to_download.transmission import TransmissionAPI
+DOWNLOADERS = {'premiumize.me': PremiumizeMe, 'transmission': TransmissionAPI, 'default': PremiumizeMe}
+
+
+def get_downloader(login, event_loop, name='default'):
+    """ The named downloader, or a pool of them if there are several logins """
+    downloader = DOWNLOADERS.get(name)
+    if isinstance(login, (list, tuple)):
+        if len(login) > 1:
+            return DownloaderPool.from_logins(downloader, login, event_loop)
+        login = login[0] if login else None
+    return downloader(login, event_loop)
+
+
+async def download_file(downloader, segmented_downloader, file_, download_directory, on_progress=None,
+                        admission=None, on_hash=None, known_hash=None):
+    """ Download with parallel resumable segments if the file has a direct link, else with the downloader """
+    link = getattr(file_, 'link', None)
+    if segmented_downloader is not None and link:
+        os.makedirs(download_directory, exist_ok=True)
+        return await segmented_downloader.download(link, os.path.join(download_directory, file_.name),
+                                                   size=getattr(file_, 'size', None), on_progress=on_progress,
+                                                   on_hash=on_hash, known_hash=known_hash)
+    return await _download_admitted(admission, download_directory, _get_bytes_to_write(downloader, [file_],
+                                                                                        download_directory),
+                                    downloader.download_file, file_, download_directory)
+
+
+async def download_transfer(downloader, transfer, download_directory, admission=None):
+    """ Download all files of the transfer with the downloader, once their size fits on the disk """
+    size = None
+    if admission is not None and hasattr(downloader, 'get_files_from_transfer'):
+        files = await downloader.get_files_from_transfer(transfer)
+        size = _get_bytes_to_write(downloader, files, download_directory) if files else None
+    return await _download_admitted(admission, download_directory, size,
+                                    downloader.download_transfer, transfer, download_directory)
+
+
+def _get_bytes_to_write(downloader, files, download_directory):
+    """ What the files take on the disk of the directory. Downloaders that link their files into it tell themselves. """
+    if hasattr(downloader, 'get_bytes_to_write'):
+        return downloader.get_bytes_to_write(files, download_directory)
+    return sum(getattr(file_, 'size', None) or 0 for file_ in files)
+
+
+async def _download_admitted(admission, download_directory, size, download, *args):
+    """ Reserve the size for the download on the disk of the directory, if both are known """
+    if admission is None or not size:
+        return await download(*args)
+    await admission.reserve(download_directory, size)
+    try:
+        return await download(*args)
+    finally:
+        await admission.release(download_directory, size)
 
 
 class Torrent2Download:
+    """ Download the torrents of the shows, reusing existing and cached transfers.
+
+    How the remaining links of a torrent are tried depends on the strategy:
+     - sequential: upload one link at a time, within a download slot
+     - first-wins: upload `parallel_links` links at once within a download slot and keep the first transfer to finish
+     - queue: upload without waiting for a download slot, the transfers run in the downloader meanwhile and only the
+       download takes a slot. The transfers have slots of their own, QUEUED_TRANSFERS per download slot.
+    Downloads of finished transfers are retried, segmented downloads resume where the last attempt stopped."""
+    STRATEGIES = ('sequential', 'first-wins', 'queue')
+    # Every attempt of a segmented download already retries each segment and resumes what was written, a download
+    # that still fails is more likely broken than unlucky, and its slot is better used for the next link
+    DOWNLOAD_RETRIES = 3
     CONCURRENT_DOWNLOADS = 15
-
-    def __init__(self, login, event_loop):
+    PER_SHOW_DOWNLOADS = 5
+    # Unfinished downloads of a show, including those waiting for a slot, before its queue is not read any further
+    PENDING_DOWNLOADS = 20
+    CACHE_CHECK_BATCH = 100
+    # Transfers of the queue strategy per download slot
+    QUEUED_TRANSFERS = 2
+
+    def __init__(self, login, event_loop, parallel_links=1, stall_timeout=30*60, segments=4, journal=None,
+                 concurrent_downloads=None, per_show_downloads=None, adaptive=None, bandwidth=None,
+                 disk_margin=1 << 30, write_buffer=8 << 20, downloader='default', strategy=None, get_fallbacks=None):
         self.event_loop = event_loop
-        downloader = DOWNLOADERS.get('default')
-        self.torrent_downloader = downloader(login, self.event_loop)
-
-        self.download_semaphore = asyncio.Semaphore(self.CONCURRENT_DOWNLOADS)
+        self.torrent_downloader = get_downloader(login, self.event_loop, downloader)
+        self.transfer_registry = TransferRegistry(self.torrent_downloader, self.event_loop)
+        self.transfer_poller = TransferPoller(self.torrent_downloader, self.event_loop,
+                                              on_transfers=self.transfer_registry.update)
+
+        # Shared by all shows: new episodes before holes before backfill, no show hogging all slots
+        self.scheduler = DownloadScheduler(concurrent_downloads or self.CONCURRENT_DOWNLOADS,
+                                           per_show_downloads or self.PER_SHOW_DOWNLOADS)
+        # Upload the best `parallel_links` links at once and keep the first transfer to finish
+        self.parallel_links = max(1, parallel_links)
+        self.strategy = strategy if strategy else ('first-wins' if self.parallel_links > 1 else 'queue')
+        if self.strategy not in self.STRATEGIES:
+            raise ValueError('Unknown download strategy {}'.format(self.strategy))
+        # The transfers of the queue strategy, from their upload until their download is done or they are deleted
+        self.transfer_scheduler = DownloadScheduler(self.QUEUED_TRANSFERS * self.scheduler.limit,
+                                                    self.QUEUED_TRANSFERS * self.scheduler.per_show)
+        self.stall_timeout = stall_timeout
+        self.cached = set()
+        # The file downloads of the segmented downloader, their limit follows the observed throughput and errors if
+        # `adaptive` is (min, max). The slots above also wait for uploads and transfers, which tells nothing about it.
+        self.file_scheduler = DownloadScheduler(self.scheduler.limit, self.scheduler.per_show)
+        self.concurrency = AdaptiveConcurrency(self.file_scheduler, *adaptive) if adaptive else None
+        # Files wait for disk space instead of filling the disk mid-download
+        self.admission = DiskSpaceAdmission(disk_margin)
+        if bandwidth is not None and not segments:
+            logging.warning('The bandwidth limits only apply to segmented downloads')
+        self.segmented_downloader = SegmentedDownloader(self.event_loop, segments=segments, monitor=self.concurrency,
+                                                        bandwidth=bandwidth, admission=self.admission,
+                                                        write_buffer=write_buffer) \
+            if segments else None
+        self.journal = journal
+        # The (show, torrent) that were dropped for the best link of a torrent, to try once it failed
+        self.get_fallbacks = get_fallbacks
 
         self.shutdown = False
         self.tasks = []
 
+    @staticmethod
+    def _get_download_directory(information, reference):
+        download_directory = os.path.join(information.download_directory, str(information.show.get_storage_name()))
+        if type(reference) == Episode:
+            season_ = information.show.seasons.get(reference.season)
+            download_directory = os.path.join(download_directory, str(season_))
+        return download_directory
+
+    @staticmethod
+    def _get_link_name(torrent_link):
+        _dn = re.search(r'&dn=(.*?)&', torrent_link)
+        return _dn.group(1) if _dn else torrent_link[40:80]
+
+    async def _check_cache(self, torrents):
+        """ Ask the downloader in batches which infohashes it has cached, i.e. are downloadable instantly """
+        check_cache = getattr(self.torrent_downloader, 'check_cache', None)
+        if check_cache is None:
+            return set()
+
+        infohashes = sorted({infohash for torrent in torrents for infohash in torrent.infohashes})
+        batches = [infohashes[i:i + self.CACHE_CHECK_BATCH] for i in range(0, len(infohashes), self.CACHE_CHECK_BATCH)]
+        cached = set()
+        for batch_cached in await asyncio.gather(*[check_cache(batch) for batch in batches]):
+            cached.update(batch_cached if batch_cached else [])
+        logging.debug('{} of {} torrents are cached'.format(len(cached), len(infohashes)))
+        return cached
+
+    def _record(self, state, information, reference, *args):
+        if self.journal is not None:
+            getattr(self.journal, 'record_' + state)(information.show, reference, *args)
+
+    def _get_hash_algorithm(self):
+        # The piece size is part of the algorithm, hash_file needs it to check the file again
+        return '{}:{}'.format(SegmentedDownloader.HASH_NAME, self.segmented_downloader.piece_size)
+
+    def _record_hash(self, information, reference, path, digest):
+        if self.journal is not None:
+            self.journal.record_file_hash(information.show, reference, path, self._get_hash_algorithm(), digest)
+
+    def _get_known_hash(self, path):
+        """ The digest recorded by an earlier download of the file, if it was computed the same way """
+        recorded = self.journal.get_file_hash(path) if self.journal is not None else None
+        if recorded is not None and recorded[0] == self._get_hash_algorithm():
+            return recorded[1]
+
+    def _get_journaled_transfer(self, information, reference):
+        job = self.journal.get(information.show, reference) if self.journal is not None else None
+        if job and job['transfer_id']:
+            return self.transfer_registry.get_by_id(job['transfer_id'])
+
+    async def _upload(self, torrent_link, information, reference):
+        transfer = await self.torrent_downloader.upload(torrent_link)
+        if transfer:
+            self._record('uploaded', information, reference, transfer)
+        return transfer
+
     async def _download_torrent(self, torrent, information):
+        if self.journal is not None:
+            self.journal.record_searched(information.show, torrent)
+        existing = self._get_journaled_transfer(information, torrent.reference) or \
+            self.transfer_registry.get_by_infohash(torrent.infohashes[0]) or \
+            self.transfer_registry.get_for_reference(information.show, torrent.reference)
+        if existing is not None:
+            success = await self._download_existing(existing, torrent, information)
+            if success:
+                return success
+
+        if torrent.infohashes[0] in self.cached:
+            success = await self._download_cached(torrent, information)
+            if success:
+                return success
+
+        if self.strategy == 'first-wins':
+            return await self._download_torrent_first_wins(torrent, information)
+        if self.strategy == 'queue':
+            return await self._download_torrent_queued(torrent, information)
+
         for torrent_link in torrent.links:
-            async with self.download_semaphore:
+            async with self.scheduler.slot(information.show.get_storage_name(), torrent.reference):
                 if self.shutdown:
                     return
 
-                _dn = re.search(r'&dn=(.*?)&', torrent_link)
                 logging.info('Uploading torrent {} ({})...'.format(torrent.reference,
-                                                                   _dn.group(1) if _dn else torrent_link[40:80]))
-                transfer = await self.torrent_downloader.upload(torrent_link)
+                                                                   self._get_link_name(torrent_link)))
+                transfer = await self._upload(torrent_link, information, torrent.reference)
                 if not transfer:
                     return
 
@@ -52,179 +225,246 @@ class Torrent2Download:
                     await self.torrent_downloader.delete(transfer)
                     return
 
-                download_directory = os.path.join(information.download_directory,
-                                                  str(information.show.get_storage_name()))
-                if type(torrent.reference) == Episode:
-                    season_ = information.show.seasons.get(torrent.reference.season)
-                    download_directory = os.path.join(download_directory, str(season_))
-
-                logging.info('Downloading {}...'.format(transfer.name))
-                success = await self.torrent_downloader.download_transfer(transfer, download_directory)
+                success = await self._download_transfer(transfer, information, torrent.reference)
                 if success:
-                    logging.info('Success! Deleting torrent...')
-                    await self.torrent_downloader.delete(transfer)
                     return success
-                logging.error('Error! Could not download torrent, was {}'.format(success))
-
-    async def close(self):
-        self.shutdown = True
-        [w.cancel() for w in self.tasks]
 
-        if self.tasks:
-            logging.info('Waiting 5 secs for all downloaders to abort...')
-            await asyncio.wait(self.tasks, timeout=5)
-
-        await self.torrent_downloader.close()
-
-    async def download(self, information):
-        logging.info('Downloading {}...'.format(information.show.name))
-
-        downloads = asyncio.gather(*[self._download_torrent(torrent, information)
-                                     for torrent in information.torrents if torrent])
-        self.tasks.append(downloads)
-        await downloads
+    async def _download_torrent_or_fallbacks(self, torrent, information):
+        try:
+            success = await self._download_torrent(torrent, information)
+        except NotEnoughDiskSpace as e:
+            # Any other link would not fit either, the job stays pending with its transfer for a later run
+            logging.error('{} - {}, leaving {} for a later run'.format(information.show.name, e, torrent.reference))
+            return
+        if success or self.shutdown:
+            return success
+        self._record('failed', information, torrent.reference)
+        if self.get_fallbacks is None:
+            return success
+        for show, fallback in self.get_fallbacks(torrent):
+            logging.info('{} - {} failed, trying the links of {} it satisfied'.format(
+                information.show.name, torrent.reference, fallback.reference))
+            fallback_information = copy.copy(information)
+            fallback_information.show = show
+            fallback.prefer(self.cached)
+            await self._download_torrent_or_fallbacks(fallback, fallback_information)
+        return success
+
+    async def _download_existing(self, transfer, torrent, information):
+        logging.info('{} - {} is already available as {}'.format(information.show, torrent.reference, transfer.name))
+        async with self.scheduler.slot(information.show.get_storage_name(), torrent.reference):
+            if self.shutdown:
+                return
+            transfer = await self._wait_for_first_transfer([transfer], torrent.reference)
+            if transfer is not None:
+                return await self._download_transfer(transfer, information, torrent.reference)
+
+    async def _download_cached(self, torrent, information):
+        """ Upload the cached best link, its transfer finishes right away. If it fails, the other links are left. """
+        async with self.scheduler.slot(information.show.get_storage_name(), torrent.reference):
+            if self.shutdown:
+                return
+            torrent_link = torrent.links[0]
+            logging.info('Uploading cached torrent {} ({})...'.format(torrent.reference,
+                                                                       self._get_link_name(torrent_link)))
+            transfer = await self._upload(torrent_link, information, torrent.reference)
+            if not transfer:
+                return
+            finished = await self._wait_for_first_transfer([transfer], torrent.reference)
+            success = None
+            if finished is not None and not self.shutdown:
+                success = await self._download_transfer(finished, information, torrent.reference)
+            if not success:
+                await self.torrent_downloader.delete(finished if finished is not None else transfer)
+                torrent.remove_infohashes({torrent.infohashes[0]})
+            return success
+
+    async def _download_torrent_queued(self, torrent, information):
+        for torrent_link in torrent.links:
+            async with self.transfer_scheduler.slot(information.show.get_storage_name(), torrent.reference):
+                if self.shutdown:
+                    return
+                success = await self._download_link_queued(torrent_link, torrent, information)
+            if success:
+                return success
+
+    async def _download_link_queued(self, torrent_link, torrent, information):
+        logging.info('Uploading torrent {} ({})...'.format(torrent.reference, self._get_link_name(torrent_link)))
+        transfer = await self._upload(torrent_link, information, torrent.reference)
+        if not transfer:
+            return
+        finished = await self._wait_for_first_transfer([transfer], torrent.reference)
+        if finished is None:
+            await self.torrent_downloader.delete(transfer)
+            return
 
-    def __bool__(self):
-        return bool(self.torrent_downloader)
+        async with self.scheduler.slot(information.show.get_storage_name(), torrent.reference):
+            if self.shutdown:
+                await self.torrent_downloader.delete(finished)
+                return
+            return await self._download_transfer(finished, information, torrent.reference)
+
+    async def _retry(self, name, download, *args, **kwargs):
+        """ The download of a finished transfer fails for passing reasons, like a dropped connection """
+        success = None
+        for retry in range(self.DOWNLOAD_RETRIES):
+            success = await download(*args, **kwargs)
+            if success or self.shutdown:
+                break
+            if retry + 1 < self.DOWNLOAD_RETRIES:
+                logging.warning('Download of {} failed, retrying ({}/{})'.format(name, retry + 1,
+                                                                                 self.DOWNLOAD_RETRIES - 1))
+        return success
+
+    async def _download_transfer(self, transfer, information, reference):
+        download_directory = self._get_download_directory(information, reference)
+
+        logging.info('Downloading {}...'.format(transfer.name))
+        files = await self._get_files(transfer, reference)
+        if files:
+            success = True
+            for file_ in files:
+                path = os.path.join(download_directory, file_.name)
+                self._record('downloading', information, reference, path)
+                async with self.file_scheduler.slot(information.show.get_storage_name(), reference):
+                    success = await self._retry(file_.name, download_file, self.torrent_downloader,
+                                                self.segmented_downloader, file_, download_directory,
+                                                on_progress=lambda bytes_written: self._record(
+                                                    'downloading', information, reference, path, bytes_written),
+                                                admission=self.admission,
+                                                on_hash=lambda digest: self._record_hash(information, reference,
+                                                                                         path, digest),
+                                                known_hash=self._get_known_hash(path)) \
+                        and success
+        else:
+            self._record('downloading', information, reference, download_directory)
+            success = await self._retry(transfer.name, download_transfer, self.torrent_downloader, transfer,
+                                        download_directory, admission=self.admission)
+        if success:
+            self._record('done', information, reference)
+            logging.info('Success! Deleting torrent...')
+            await self.torrent_downloader.delete(transfer)
+            return success
+        logging.error('Error! Could not download torrent, was {}'.format(success))
+
+    async def _get_files(self, transfer, reference):
+        """ The files of the transfer if they can be downloaded directly, else None """
+        if self.segmented_downloader is None:
+            return
+        files = None
+        if hasattr(self.torrent_downloader, 'get_files_from_transfer'):
+            files = await self.torrent_downloader.get_files_from_transfer(transfer)
+        # A season pack has many files, without a listing only the downloader itself knows how to fetch them all
+        if files is None and type(reference) == Episode:
+            files = [await self.torrent_downloader.get_file_from_transfer(transfer)]
+        if files and all(getattr(file_, 'link', None) for file_ in files):
+            return files
+
+    async def _download_torrent_first_wins(self, torrent, information):
+        for i in range(0, len(torrent.links), self.parallel_links):
+            async with self.scheduler.slot(information.show.get_storage_name(), torrent.reference):
+                if self.shutdown:
+                    return
 
+                links = torrent.links[i:i + self.parallel_links]
+                logging.info('Uploading {} torrents for {} ({})...'.format(
+                    len(links), torrent.reference, ', '.join(map(self._get_link_name, links))))
+                transfers = [t for t in await asyncio.gather(*[self._upload(link, information, torrent.reference)
+                                                               for link in links]) if t]
 
-class Torrent2Download_:
-    CHECK_EVERY = 2
-    WORKER_PER_SHOW = 5
+                transfer = await self._wait_for_first_transfer(transfers, torrent.reference)
+                await asyncio.gather(*[self.torrent_downloader.delete(t) for t in transfers
+                                       if transfer is None or t.id != transfer.id])
+                if transfer is None:
+                    continue
 
-    def __init__(self, login, event_loop):
-        self.event_loop = event_loop
-        downloader = DOWNLOADERS.get('default')
-        self.torrent_downloader = downloader(login, self.event_loop)
+                if self.shutdown:
+                    await self.torrent_downloader.delete(transfer)
+                    return
 
-        self.downloads_queue = asyncio.Queue()
-        self.all_workers = []
+                success = await self._download_transfer(transfer, information, torrent.reference)
+                if success:
+                    return success
 
-        self.shutdown = False
+    async def _wait_for_first_transfer(self, transfers, reference):
+        """ Poll the transfers until one is finished. Failed transfers and those without progress are given up. """
+        start_time = datetime.datetime.now()
+        pending = {id(t): t for t in transfers}
+        last_progress = {key: (None, self.event_loop.time()) for key in pending}
+        while pending and not self.shutdown:
+            # One poll of the transfer list answers all of them
+            updated = await asyncio.gather(*[self.transfer_poller.get_transfer(t) for t in pending.values()])
+            for key, transfer in zip(list(pending.keys()), updated):
+                if transfer is None:
+                    pending.pop(key)
+                    continue
+                pending[key] = transfer
+                finished = self.torrent_downloader.is_transfer_finished(transfer, start_time)
+                if finished is True:
+                    return transfer
+                # A transfer without a progress value makes none, it is given up after stall_timeout as well
+                progress = getattr(transfer, 'progress', None)
+                if progress is not None and progress != last_progress[key][0]:
+                    last_progress[key] = (progress, self.event_loop.time())
+                elif self.event_loop.time() - last_progress[key][1] > self.stall_timeout:
+                    logging.info('Transfer {} for {} stalled, giving up on it'.format(transfer.name, reference))
+                    finished = False
+                if finished is False:
+                    pending.pop(key)
 
     async def close(self):
         self.shutdown = True
-        [w.cancel() for w in self.all_workers]
+        [w.cancel() for w in self.tasks]
 
-        await asyncio.wait(self.all_workers, timeout=self.CHECK_EVERY)
+        if self.tasks:
+            logging.info('Waiting 5 secs for all downloaders to abort...')
+            await asyncio.wait(self.tasks, timeout=5)
 
+        await self.transfer_poller.close()
+        if self.concurrency is not None:
+            await self.concurrency.close()
+        if self.segmented_downloader is not None:
+            await self.segmented_downloader.close()
         await self.torrent_downloader.close()
 
-    async def download_from_cache(self, information):
-        show_transfers = [transfer for transfer in await self.torrent_downloader.get_transfers()
-                          if information.show.name in transfer.name]
-        for show_transfer in show_transfers:
-            for episode in information.status.episodes_missing:
-                if episode.get_regex().search(show_transfer.name):
-                    logging.info('{} - {} is already available'.format(information.show, episode))
-                    download = Download(information, episode, show_transfer, self.torrent_downloader)
-                    await self.downloads_queue.put(download)
-                    information.status.episodes_missing.remove(episode)
-                    for torrent in information.torrents:
-                        if torrent.reference == episode:
-                            information.torrents.remove(torrent)
-
-            for season in information.status.seasons_missing:
-                if season.get_regex().search(show_transfer.name):
-                    logging.info('{} - Season {} is already available'.format(information.show, season.number))
-                    download = Download(information, season, show_transfer, self.torrent_downloader)
-                    await self.downloads_queue.put(download)
-                    information.status.seasons_missing.remove(season)
-                    for torrent in information.torrents:
-                        if torrent.reference == season:
-                            information.torrents.remove(torrent)
-
-        return information
-
     async def download(self, information):
-        logging.info('Downloading {}...'.format(information.show.name))
+        queue = asyncio.Queue()
+        for torrent in information.torrents:
+            queue.put_nowait(torrent)
+        queue.put_nowait(None)
+        await self.download_queue(information, queue)
 
-        await self._start_torrenting(information)
+    async def download_queue(self, information, queue):
+        """ Download the torrents of the queue as they arrive, until a None.
 
-        workers = [asyncio.ensure_future(self.worker()) for _ in range(self.WORKER_PER_SHOW)]
-        self.all_workers.extend(workers)
-        await asyncio.gather(*workers)
-
-    async def _start_torrenting(self, information):
-        logging.debug('Start torrenting {}...'.format(information.show.name))
-
-        information = await self.download_from_cache(information)
-
-        # FIXME: is the list the same reference for all tasks? call by value or reference?
-        transfer_list_ = []
-        tasks = [asyncio.ensure_future(self._upload_torrent(torrent, transfer_list_, information))
-                        for torrent in information.torrents]
-        await asyncio.gather(*tasks)
-
-    async def _upload_torrent(self, torrent, transfer_list_, information):
-        if torrent is None:
-            return
-        for link in torrent.links:
-            transfer = await self.torrent_downloader.upload(link)
-            if transfer is not None:
-                if transfer.id not in transfer_list_:
-                    transfer_list_.append(transfer.id)
-                    download = Download(information, torrent.reference, transfer, self.torrent_downloader)
-                    await self.downloads_queue.put(download)
-                    return
-                logging.warning('Link "{}" for "{}" was a duplicate'.format(link[:50], torrent.reference))
-
-    async def worker(self):
-        try:
-            while True:
-                download = self.downloads_queue.get_nowait()
-                # Allow a context switch here so that other workers can get_nowait and realize the queue is only 1 elem
-                await asyncio.sleep(.1)
-
-                if download.start_time is None:
-                    download.start_time = datetime.datetime.now()
-
-                download.transfer = await download.downloader.get_transfer(download.transfer)
-                finished = download.downloader.is_transfer_finished(download.transfer, download.start_time)
-
-                if finished is None:
-                    self.downloads_queue.put_nowait(download)
-                elif finished is True:
-                    if await self._worker_handle_download(download):
-                        self.downloads_queue.put_nowait(download)
-
-                self.downloads_queue.task_done()
-
-                await asyncio.sleep(5)
-
-        except asyncio.QueueEmpty:
-            logging.debug('Downloads_Queue is empty, work is finished.')
-        except RuntimeError:
-            logging.debug('Worker was being cancelled.')
-        except Exception as e:
-            logging.error('Worker got exception: "{}"'.format(repr(e)))
-
-    async def _worker_handle_download(self, download):
-        download_directory = os.path.join(download.information.download_directory,
-                                          str(download.information.show.get_storage_name()))
-        if type(download.reference) == Episode:
-            season_ = download.information.show.seasons.get(download.reference.season)
-            download_directory = os.path.join(download_directory, str(season_))
-
-        os.makedirs(download_directory, exist_ok=True)
-
-        file_ = await download.downloader.get_file_from_transfer(download.transfer)
-        if file_:
-            if await download.downloader.download_file(file_, download_directory):
-                await self._cleanup(download, file_)
-                logging.debug('Finished downloading {} {}'.format(download.information.show.name,
-                                                                  download.reference))
-            elif download.retries > 0:
-                download.retries -= 1
-                return True
-        else:
-            logging.error('Download {} {} was not downloadeable.'.format(download.information.show.name,
-                                                                         download.reference))
-
-    @staticmethod
-    async def _cleanup(download, file_):
-        logging.info('Cleaning up {}'.format(file_.name))
-        await download.downloader.delete(file_)
+        Takes no more torrents while PENDING_DOWNLOADS of the show are unfinished, so a full queue holds back the
+        searches feeding it. Whatever is waiting in the queue is checked against the cache in one batch. """
+        logging.info('Downloading {}...'.format(information.show.name))
+        await self.transfer_registry.refresh()
+        if self.concurrency is not None:
+            self.concurrency.start()
+
+        pending = asyncio.Semaphore(self.PENDING_DOWNLOADS)
+        downloads = []
+        finished = False
+        while not finished and not self.shutdown:
+            torrents = [await queue.get()]
+            while not queue.empty() and len(torrents) < self.CACHE_CHECK_BATCH:
+                torrents.append(queue.get_nowait())
+            finished = None in torrents
+            torrents = [torrent for torrent in torrents if torrent]
+            self.cached.update(await self._check_cache(torrents))
+
+            for torrent in torrents:
+                torrent.prefer(self.cached)
+                await pending.acquire()
+                download = asyncio.ensure_future(self._download_torrent_or_fallbacks(torrent, information))
+                download.add_done_callback(lambda _: pending.release())
+                downloads.append(download)
+                self.tasks.append(download)
+                download.add_done_callback(self.tasks.remove)
+        await asyncio.gather(*downloads)
 
     def __bool__(self):
         return bool(self.torrent_downloader)
+
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+
+
+class TransferPoller:
+    """ Fetch the whole transfer list once per interval and hand each waiting download its transfer.
+
+    The interval adapts: fast while a waited-for transfer is near completion, slow while nothing progresses."""
+    def __init__(self, downloader, event_loop, fast=2, normal=10, slow=60, near_completion=.9, on_transfers=None):
+        self.downloader = downloader
+        self.event_loop = event_loop
+        # Called with every fetched transfer list, e.g. to keep a TransferRegistry current
+        self.on_transfers = on_transfers
+        self.fast, self.normal, self.slow = fast, normal, slow
+        self.near_completion = near_completion
+
+        self.interval = fast
+        self.waiters = {}
+        self.progress = {}
+        self.polls = 0
+        self.last_poll = None
+        self.task = None
+
+    async def get_transfer(self, transfer):
+        """ The state of the transfer after the next poll, None if it does not exist anymore """
+        future = self.event_loop.create_future()
+        self.waiters.setdefault(transfer.id, []).append(future)
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._poll())
+        return await future
+
+    async def _poll(self):
+        try:
+            if self.last_poll is not None:
+                await asyncio.sleep(max(0, self.last_poll + self.interval - self.event_loop.time()))
+            while self.waiters:
+                waiters, self.waiters = self.waiters, {}
+                try:
+                    transfer_list = await self.downloader.get_transfers()
+                    transfers = {t.id: t for t in transfer_list}
+                    if self.on_transfers is not None:
+                        self.on_transfers(transfer_list)
+                except Exception as e:
+                    logging.warning('Polling the transfers failed: {}'.format(repr(e)))
+                    transfers = None
+                self.polls += 1
+                self.last_poll = self.event_loop.time()
+
+                if transfers is None:
+                    # Keep the waiters for the next poll
+                    [self.waiters.setdefault(id_, []).extend(futures) for id_, futures in waiters.items()]
+                else:
+                    for id_, futures in waiters.items():
+                        [f.set_result(transfers.get(id_)) for f in futures if not f.done()]
+                    self.interval = self._get_interval([transfers[id_] for id_ in waiters if id_ in transfers])
+
+                await asyncio.sleep(self.interval)
+        finally:
+            # Do not leave anyone hanging on cancellation
+            [f.cancel() for futures in self.waiters.values() for f in futures if not f.done()]
+
+    def _get_interval(self, transfers):
+        progress = {t.id: getattr(t, 'progress', None) for t in transfers}
+        changed = any(self.progress.get(id_) != p for id_, p in progress.items())
+        self.progress = progress
+
+        if any(p is not None and p >= self.near_completion for p in progress.values()):
+            return self.fast
+        if all(p is None for p in progress.values()):
+            return self.normal
+        return self.normal if changed else self.slow
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
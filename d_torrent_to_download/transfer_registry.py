@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import re
+
+from a_argument_to_show.release_name import parse_release_name
+from c_status_to_torrent.status2torrent import get_infohash
+
+
+def get_show_key(name):
+    """ Lowercase word tokens of a show name, without a trailing year like in "Doctor Who (2005)" """
+    tokens = tuple(re.findall(r'[a-z0-9]+', name.lower()))
+    while len(tokens) > 1 and re.match(r'(19|20)\d\d$', tokens[-1]):
+        tokens = tokens[:-1]
+    return tokens
+
+
+class TransferRegistry:
+    """ The existing transfers of the downloader, fetched once per run and refreshed on a schedule.
+
+    Indexed by infohash and by (show, season, episode) - episode None for season packs - for O(1) lookups."""
+    def __init__(self, downloader, event_loop, refresh_every=60):
+        self.downloader = downloader
+        self.event_loop = event_loop
+        self.refresh_every = refresh_every
+
+        self.by_id = {}
+        self.by_infohash = {}
+        self.by_episode = {}
+        self.last_refresh = None
+        self.lock = asyncio.Lock()
+
+    async def refresh(self, force=False):
+        async with self.lock:
+            if not force and self.last_refresh is not None and \
+                    self.event_loop.time() - self.last_refresh < self.refresh_every:
+                return
+            try:
+                self.update(await self.downloader.get_transfers())
+            except Exception as e:
+                logging.warning('Could not fetch the transfers: {}'.format(repr(e)))
+
+    def update(self, transfers):
+        by_id, by_infohash, by_episode = {}, {}, {}
+        for transfer in transfers:
+            by_id[str(transfer.id)] = transfer
+            infohash = getattr(transfer, 'hash', None) or get_infohash(getattr(transfer, 'src', '') or '')
+            if infohash:
+                by_infohash[infohash.lower()] = transfer
+
+            release = parse_release_name(transfer.name)
+            show_key = get_show_key(' '.join(release.show_tokens))
+            for season, episode in release.get_keys():
+                by_episode.setdefault((show_key, season, episode), transfer)
+
+        self.by_id, self.by_infohash, self.by_episode = by_id, by_infohash, by_episode
+        self.last_refresh = self.event_loop.time()
+
+    def get_by_id(self, transfer_id):
+        return self.by_id.get(str(transfer_id))
+
+    def get_by_infohash(self, infohash):
+        return self.by_infohash.get(infohash)
+
+    def get_for_reference(self, show, reference):
+        if hasattr(reference, 'episode'):
+            key = (get_show_key(show.get_search_query()), reference.season, reference.episode)
+        else:
+            key = (get_show_key(show.get_search_query()), reference.number, None)
+        return self.by_episode.get(key)
@@ -0,0 +1,192 @@
+import asyncio
+import base64
+import errno
+import logging
+import os
+import shutil
+from urllib.parse import urlparse
+
+import aiohttp
+
+VIDEO_EXTENSIONS = ('.mkv', '.mp4', '.avi', '.m4v', '.mov', '.wmv', '.ts')
+
+
+class TransmissionFile:
+    def __init__(self, transfer, data):
+        self.transfer = transfer
+        self.name = os.path.basename(data['name'])
+        self.path = os.path.join(transfer.download_dir, data['name'])
+        self.size = data.get('length')
+        self.done = data.get('bytesCompleted') == self.size
+
+
+class TransmissionTransfer:
+    def __init__(self, data):
+        self.id = data['id']
+        self.name = data.get('name', '')
+        self.hash = data.get('hashString')
+        self.progress = data.get('percentDone', 0.)
+        self.error = data.get('error', 0)
+        self.error_string = data.get('errorString', '')
+        self.download_dir = data.get('downloadDir', '')
+        self.files = [TransmissionFile(self, file_) for file_ in data.get('files', [])]
+
+    def __repr__(self):
+        return '{} ({:.0%})'.format(self.name, self.progress)
+
+
+class TransmissionAPI:
+    """ A local Transmission daemon behind the interface of the premiumize.me downloader.
+
+    The files of a finished transfer are hardlinked into the library, or moved if it is on another file system, so
+    nothing is downloaded twice. Login is "user:password", a file containing it, or the full rpc url with them."""
+    DEFAULT_URL = 'http://localhost:9091/transmission/rpc'
+    FIELDS = ['id', 'name', 'hashString', 'percentDone', 'error', 'errorString', 'downloadDir', 'files']
+    # error 3 is a local error, 1 and 2 are only tracker warnings and errors
+    LOCAL_ERROR = 3
+
+    def __init__(self, login, event_loop, timeout=30):
+        self.event_loop = event_loop
+        self.url, self.auth_header = self._parse_login(login)
+        self.timeout = timeout
+        self.session_id = None
+        self.aiohttp_session = None
+
+    def _get_session(self):
+        if self.aiohttp_session is None:
+            self.aiohttp_session = aiohttp.ClientSession(headers=self.auth_header,
+                                                         timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.aiohttp_session
+
+    def _parse_login(self, login):
+        if login and os.path.isfile(login):
+            with open(login) as f:
+                login = f.read().strip()
+        if login and '://' in login:
+            url = urlparse(login)
+            netloc = url.hostname + (':{}'.format(url.port) if url.port else '')
+            credentials = '{}:{}'.format(url.username, url.password or '') if url.username else None
+            return url._replace(netloc=netloc).geturl(), self._get_auth_header(credentials)
+        if login and ':' in login:
+            return self.DEFAULT_URL, self._get_auth_header(login)
+        return self.DEFAULT_URL, {}
+
+    @staticmethod
+    def _get_auth_header(credentials):
+        if not credentials:
+            return {}
+        return {'Authorization': 'Basic ' + base64.b64encode(credentials.encode()).decode()}
+
+    async def _request(self, method, **arguments):
+        """ The arguments of the response, or None on error. Answers 409 until the session id is sent along. """
+        for _ in range(2):
+            headers = {'X-Transmission-Session-Id': self.session_id} if self.session_id else {}
+            try:
+                async with self._get_session().post(self.url, json={'method': method, 'arguments': arguments},
+                                                     headers=headers) as r_:
+                    if r_.status == 409:
+                        self.session_id = r_.headers.get('X-Transmission-Session-Id')
+                        continue
+                    if r_.status != 200:
+                        logging.error('Transmission {} returned status {}'.format(method, r_.status))
+                        return
+                    response = await r_.json(content_type=None)
+            except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+                logging.error('Transmission {} failed: {}'.format(method, repr(e)))
+                return
+            if response.get('result') != 'success':
+                logging.error('Transmission {} failed: {}'.format(method, response.get('result')))
+                return
+            return response.get('arguments', {})
+
+    async def upload(self, link):
+        arguments = await self._request('torrent-add', filename=link)
+        if arguments is None:
+            return
+        added = arguments.get('torrent-added') or arguments.get('torrent-duplicate')
+        return TransmissionTransfer(added) if added else None
+
+    async def get_transfers(self):
+        arguments = await self._request('torrent-get', fields=self.FIELDS)
+        return [TransmissionTransfer(data) for data in arguments.get('torrents', [])] if arguments else []
+
+    async def get_transfer(self, transfer):
+        arguments = await self._request('torrent-get', ids=[transfer.id], fields=self.FIELDS)
+        torrents = arguments.get('torrents') if arguments else None
+        return TransmissionTransfer(torrents[0]) if torrents else None
+
+    def is_transfer_finished(self, transfer, start_time):
+        if transfer.error == self.LOCAL_ERROR:
+            logging.error('Transfer {} failed: {}'.format(transfer.name, transfer.error_string))
+            return False
+        return True if transfer.progress >= 1 else None
+
+    @staticmethod
+    def _get_wanted_files(transfer):
+        videos = [file_ for file_ in transfer.files if file_.name.lower().endswith(VIDEO_EXTENSIONS)]
+        return videos if videos else transfer.files
+
+    async def get_files_from_transfer(self, transfer):
+        return self._get_wanted_files(transfer)
+
+    async def get_file_from_transfer(self, transfer):
+        files = self._get_wanted_files(transfer)
+        return max(files, key=lambda file_: file_.size or 0) if files else None
+
+    @staticmethod
+    def _get_device(path):
+        path = os.path.abspath(path)
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return os.stat(path).st_dev
+
+    def get_bytes_to_write(self, files, download_directory):
+        """ Only files on another file system than the library are written again, the others are hardlinked """
+        library = self._get_device(download_directory)
+        return sum(file_.size or 0 for file_ in files
+                   if not os.path.exists(file_.path) or self._get_device(file_.path) != library)
+
+    @staticmethod
+    def _place(file_, download_directory):
+        """ Hardlink the file into the library, move it if that is on another file system. Never copy in place. """
+        os.makedirs(download_directory, exist_ok=True)
+        target = os.path.join(download_directory, file_.name)
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(file_.path, target)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            # Written to a temporary name first, Show2Status ignores it until it is complete
+            shutil.move(file_.path, target + '.part')
+            os.replace(target + '.part', target)
+        return True
+
+    async def download_file(self, file_, download_directory):
+        if not file_.done:
+            logging.error('{} is not complete'.format(file_.name))
+            return False
+        try:
+            return await self.event_loop.run_in_executor(None, self._place, file_, download_directory)
+        except OSError as e:
+            logging.error('Could not place {}: {}'.format(file_.name, repr(e)))
+            return False
+
+    async def download_transfer(self, transfer, download_directory):
+        files = self._get_wanted_files(transfer)
+        if not files:
+            return False
+        results = [await self.download_file(file_, download_directory) for file_ in files]
+        return all(results)
+
+    async def delete(self, transfer):
+        # The hardlinks in the library keep the data
+        return await self._request('torrent-remove', ids=[transfer.id], **{'delete-local-data': True}) is not None
+
+    async def close(self):
+        if self.aiohttp_session is not None:
+            await self.aiohttp_session.close()
+
+    def __bool__(self):
+        return True
@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 import asyncio
+import json
 import logging
 import os
 
 from a_argument_to_show.argument_to_show import Argument2Show
 from b_show_to_status.show2status import Show2Status
-from c_status_to_torrent.status2torrent import QUALITY_REGEX, Status2Torrent
-from d_torrent_to_download.torrent2download import Torrent2Download
+from c_status_to_torrent.status2torrent import QUALITY_REGEX, Status2Torrent, Torrent
+from d_torrent_to_download.bandwidth import BandwidthLimiter, parse_rate, parse_schedule
+from d_torrent_to_download.disk_space import parse_size
+from d_torrent_to_download.journal import JobJournal
+from d_torrent_to_download.torrent2download import DOWNLOADERS, Torrent2Download
 
 
 class Information:
@@ -18,15 +22,28 @@ class Information:
 
 
 class ShowManager:
+    # Torrents found but not yet taken by the downloader, per show
+    TORRENT_QUEUE = 10
+
     def __init__(self, download_directory, auth, update_missing=False,
-                 quality=None):
+                 quality=None, parallel_links=1, stall_timeout=30*60, segments=4, journal_path=None,
+                 concurrent_downloads=None, per_show_downloads=None, adaptive=None, bandwidth=None,
+                 disk_margin=1 << 30, write_buffer=8 << 20, downloader='default', strategy=None,
+                 search_options=None):
         self.download_directory = download_directory
         self.event_loop = asyncio.get_event_loop()
+        self.journal = JobJournal(journal_path) if journal_path else None
 
         self.arg2show = Argument2Show()
         self.show2status = Show2Status(update_missing)
-        self.status2torrent = Status2Torrent(quality, self.event_loop)
-        self.torrent2download = Torrent2Download(auth, self.event_loop)
+        self.status2torrent = Status2Torrent(quality, self.event_loop, grabber_options=search_options)
+        self.torrent2download = Torrent2Download(auth, self.event_loop, parallel_links=parallel_links,
+                                                 stall_timeout=stall_timeout, segments=segments, journal=self.journal,
+                                                 concurrent_downloads=concurrent_downloads,
+                                                 per_show_downloads=per_show_downloads, adaptive=adaptive,
+                                                 bandwidth=bandwidth, disk_margin=disk_margin,
+                                                 write_buffer=write_buffer, downloader=downloader,
+                                                 strategy=strategy, get_fallbacks=self.status2torrent.get_fallbacks)
 
     def _check_init(self):
         return bool(self.arg2show and self.show2status and self.status2torrent and self.torrent2download)
@@ -65,13 +82,54 @@ class ShowManager:
         show_infos.status = self.show2status.analyse(show_infos)
         if not len(show_infos.status):
             return
-        show_infos.torrents = await self.status2torrent.get_torrents(show_infos)
-        await self.torrent2download.download(show_infos)
+        # status -> search -> download as a stream: a torrent is downloaded as soon as its search is done
+        queue = asyncio.Queue(self.TORRENT_QUEUE)
+        search = asyncio.ensure_future(self._search(show_infos, queue))
+        try:
+            await self.torrent2download.download_queue(show_infos, queue)
+        finally:
+            # On shutdown the queue is not read any further, the search would wait on it forever
+            search.cancel()
+            await asyncio.gather(search, return_exceptions=True)
+
+    async def _search(self, show_infos, queue):
+        """ Put the torrents of the show into the queue as they are found, then None. Waits while it is full. """
+        try:
+            for torrent in self._resume_torrents(show_infos):
+                show_infos.torrents.append(torrent)
+                await queue.put(torrent)
+            if len(show_infos.status):
+                async for torrent in self.status2torrent.iter_torrents(show_infos):
+                    show_infos.torrents.append(torrent)
+                    await queue.put(torrent)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # What was found so far is still downloaded
+            logging.error('{} - Searching failed: {}'.format(show_infos.show.name, repr(e)))
+        await queue.put(None)
+
+    def _resume_torrents(self, show_infos):
+        """ Take the torrents of unfinished jobs of a previous run from the journal, instead of searching again """
+        if self.journal is None:
+            return []
+        jobs = {job['reference']: job for job in self.journal.get_pending(show_infos.show) if job['links']}
+        torrents = []
+        for references in (show_infos.status.episodes_missing, show_infos.status.seasons_missing):
+            for reference in list(references):
+                job = jobs.get(repr(reference))
+                if job is not None:
+                    logging.info('{} - Resuming {} ({})'.format(show_infos.show.name, reference, job['state']))
+                    torrents.append(Torrent.from_links(reference, json.loads(job['links'])))
+                    references.remove(reference)
+        return torrents
 
     def close(self):
         self.event_loop.run_until_complete(self.status2torrent.torrent_grabber.close())
         self.event_loop.run_until_complete(self.torrent2download.close())
         self.event_loop.close()
+        if self.journal is not None:
+            self.journal.close()
 
     def get_shows_from_directory(self):
         folder_name = os.path.dirname(self.download_directory)
@@ -98,27 +156,91 @@ if __name__ == '__main__':
         raise argparse.ArgumentTypeError('{} is no directory or isn\'t writeable'.format(string))
 
 
+    def argcheck_quality_tiers(string):
+        tiers = []
+        for tier in string.split(','):
+            quality, _, encoder = tier.strip().partition(':')
+            encoder = encoder if encoder else 'all'
+            if quality not in QUALITY_REGEX.get('quality') or encoder not in QUALITY_REGEX.get('encoder'):
+                raise argparse.ArgumentTypeError('{} is no valid quality:encoder tier'.format(tier))
+            tiers.append({'quality': quality, 'encoder': encoder})
+        return tiers
+
     argparser = argparse.ArgumentParser(description="Manage your tv-show directories")
     argparser.add_argument('shows', nargs='*', type=str,
                            help='Manage these shows or let free to get the shows automatically from download_directory')
     argparser.add_argument('download_directory', type=argcheck_dir, default='.',
                            help='Set the directory to sort the file(s) into.')
-    argparser.add_argument('-a', '--auth', type=str,
-                           help="Either 'user:password' or a path to a pw-file with that format (for premiumize.me)")
+    argparser.add_argument('-a', '--auth', type=str, action='append',
+                           help="Either 'user:password' or a path to a pw-file with that format (for premiumize.me). "
+                                "Repeat it to spread the transfers over several accounts")
+    argparser.add_argument('-d', '--downloader', type=str, choices=DOWNLOADERS.keys(), default='default',
+                           help="Service to download the torrents with. For transmission, -a is 'user:password' "
+                                "or the rpc url (default: http://localhost:9091/transmission/rpc)")
     argparser.add_argument('-u', '--update_missing', action="store_true",
                            help="update (download) missing episodes/seasons")
     argparser.add_argument('-q', '--quality', type=str, choices=QUALITY_REGEX.get('quality').keys(),
                            help="Choose the quality of the episodes to download", default='720')
     argparser.add_argument('-e', '--encoder', type=str, choices=QUALITY_REGEX.get('encoder').keys(),
                            help="Choose the encoder of the episodes to download", default='264')
+    argparser.add_argument('-p', '--profile', type=argcheck_quality_tiers,
+                           help="Ordered quality tiers as quality:encoder, e.g. '1080:265,1080:264,720:all,all:all'. "
+                                "The first tier with results is downloaded. Overrides -q/-e")
+    argparser.add_argument('-k', '--parallel_links', type=int, default=1,
+                           help="Upload the best K links of an episode at once and keep the first to finish")
+    argparser.add_argument('--strategy', type=str, choices=Torrent2Download.STRATEGIES, default=None,
+                           help="How the links of a torrent are tried: one after another, the first of K to finish, "
+                                "or transfers ahead of the download slots, twice as many as there are "
+                                "(default: first-wins with -k > 1, else queue)")
+    argparser.add_argument('--stall_timeout', type=int, default=30*60,
+                           help="Give up a transfer after this many seconds without progress")
+    argparser.add_argument('-s', '--segments', type=int, default=4,
+                           help="Download every file in this many parallel, resumable segments (0 to disable)")
+    argparser.add_argument('-j', '--journal', type=str, default=None,
+                           help="Path of a job journal to resume interrupted downloads from, "
+                                "e.g. ~/.cache/show_downloader/journal.sqlite (default: none)")
+    argparser.add_argument('-c', '--concurrent_downloads', type=int, default=None,
+                           help="Maximum number of downloads across all shows (default: 15)")
+    argparser.add_argument('--per_show', type=int, default=None,
+                           help="Maximum number of downloads of a single show (default: 5)")
+    argparser.add_argument('--adaptive', type=int, nargs=2, metavar=('MIN', 'MAX'), default=None,
+                           help="Adapt the number of segmented file downloads between MIN and MAX to their "
+                                "throughput and errors, within -c")
+    argparser.add_argument('--max_rate', type=parse_rate, default=None,
+                           help="Total bandwidth of the segmented downloads, e.g. '10M' for 10 MiB/s "
+                                "(default: unlimited)")
+    argparser.add_argument('--max_rate_per_download', type=parse_rate, default=None,
+                           help="Bandwidth of a single segmented file download, e.g. '2M'")
+    argparser.add_argument('--rate_schedule', type=parse_schedule, default=(),
+                           help="Total bandwidth of the segmented downloads by time of day as start-end:rate, "
+                                "e.g. '9-18:2M,22-6:0'. Hours outside of it use --max_rate, 0 is unlimited")
+    argparser.add_argument('--disk_margin', type=parse_size, default=1 << 30,
+                           help="Free disk space to keep, a download that would use it is deferred (default: 1G)")
+    argparser.add_argument('--write_buffer', type=parse_size, default=8 << 20,
+                           help="Bytes of every download segment to collect before writing them (default: 8M)")
+    argparser.add_argument('--search_rate', type=float, default=1.,
+                           help="Searches per second against a single proxy (default: 1)")
+    argparser.add_argument('--search_burst', type=int, default=5,
+                           help="Searches a single proxy may get at once before --search_rate applies (default: 5)")
+    argparser.add_argument('--search_cache', type=str, default=None,
+                           help="Path of the search result cache, '' to keep it in memory only "
+                                "(default: ~/.cache/show_downloader/search_cache.json)")
     argparser.add_argument('-v', '--verbose', action='store_true')
 
     args = argparser.parse_args()
-    quality_dict = {'quality': args.quality, 'encoder': args.encoder}
+    quality_dict = args.profile if args.profile else {'quality': args.quality, 'encoder': args.encoder}
 
     logging.basicConfig(format='%(message)s',
                         level=logging.DEBUG if args.verbose else logging.INFO)
 
     sm = ShowManager(args.download_directory, args.auth, update_missing=args.update_missing,
-                     quality=quality_dict)
+                     quality=quality_dict, parallel_links=args.parallel_links, stall_timeout=args.stall_timeout,
+                     segments=args.segments, journal_path=args.journal,
+                     concurrent_downloads=args.concurrent_downloads, per_show_downloads=args.per_show,
+                     adaptive=args.adaptive, disk_margin=args.disk_margin, write_buffer=args.write_buffer,
+                     downloader=args.downloader, strategy=args.strategy,
+                     search_options={'requests_per_second': args.search_rate, 'burst': args.search_burst,
+                                     'cache_path': args.search_cache},
+                     bandwidth=BandwidthLimiter(args.max_rate, args.max_rate_per_download, args.rate_schedule)
+                     if args.max_rate or args.max_rate_per_download or args.rate_schedule else None)
     sm.manage(args.shows)
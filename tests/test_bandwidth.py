@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import asyncio
+import datetime
+import unittest
+
+from hamcrest import *
+from d_torrent_to_download.bandwidth import BandwidthLimiter, parse_rate, parse_schedule, parse_schedule_entry
+
+
+class BandwidthLimiterTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.time = 0.
+        self.hour = 12
+
+        async def sleep(delay):
+            self.time += delay
+        self.sleep = asyncio.sleep
+        asyncio.sleep = sleep
+
+    def _get_limiter(self, *args, **kwargs):
+        return BandwidthLimiter(*args, clock=lambda: self.time, now=lambda: datetime.datetime(2017, 3, 1, self.hour),
+                                **kwargs)
+
+    def test_parse(self):
+        assert_that([parse_rate('500K'), parse_rate('2MiB/s'), parse_rate('1.5g'), parse_rate('0')],
+                    equal_to([500 << 10, 2 << 20, 3 << 29, 0]))
+        assert_that(parse_schedule_entry('22-6:1M'), equal_to((22, 6, 1 << 20)))
+        assert_that(parse_schedule('9-18:2M, 22-6:0'), equal_to([(9, 18, 2 << 20), (22, 6, 0)]))
+        self.assertRaises(ValueError, parse_rate, 'fast')
+
+    def test_schedule(self):
+        limiter = self._get_limiter(100, schedule=[(9, 18, 10), (22, 6, 0)])
+        assert_that(limiter.get_rate(), equal_to(10))
+        self.hour = 23
+        assert_that(limiter.get_rate(), equal_to(0))
+        self.hour = 7
+        assert_that(limiter.get_rate(), equal_to(100))
+
+    def test_throttle(self):
+        limiter = self._get_limiter(100)
+        for _ in range(5):
+            self.event_loop.run_until_complete(limiter.throttle(100))
+        # The first second is a burst, every further 100 bytes take one
+        assert_that(self.time, close_to(4, .01))
+
+    def test_per_download(self):
+        limiter = self._get_limiter(None, per_download=10)
+        bucket = limiter.get_download_bucket()
+        for _ in range(3):
+            self.event_loop.run_until_complete(limiter.throttle(10, bucket))
+        assert_that(self.time, close_to(2, .01))
+        self.time = 0.
+        self.event_loop.run_until_complete(limiter.throttle(1000))
+        assert_that(self.time, equal_to(0.))
+
+    def tearDown(self):
+        asyncio.sleep = self.sleep
+        self.event_loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from hamcrest import *
+from c_status_to_torrent.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTester(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self._class = CircuitBreaker('proxy', failure_threshold=3, cool_down=60, clock=self.clock)
+
+    def test_opens_after_threshold(self):
+        [self._class.record_failure() for _ in range(2)]
+        assert_that(self._class.allow_request(), equal_to(True))
+        self._class.record_failure()
+        assert_that(self._class.state, equal_to(CircuitBreaker.OPEN))
+        assert_that(self._class.allow_request(), equal_to(False))
+
+    def test_success_resets_failures(self):
+        [self._class.record_failure() for _ in range(2)]
+        self._class.record_success()
+        self._class.record_failure()
+        assert_that(self._class.state, equal_to(CircuitBreaker.CLOSED))
+
+    def test_half_open_single_probe(self):
+        [self._class.record_failure() for _ in range(3)]
+        self.clock.now = 61
+        assert_that(self._class.allow_request(), equal_to(True))
+        assert_that(self._class.state, equal_to(CircuitBreaker.HALF_OPEN))
+        assert_that(self._class.allow_request(), equal_to(False))
+
+    def test_half_open_probe_failure_reopens(self):
+        [self._class.record_failure() for _ in range(3)]
+        self.clock.now = 61
+        self._class.allow_request()
+        self._class.record_failure()
+        assert_that(self._class.state, equal_to(CircuitBreaker.OPEN))
+        assert_that(self._class.allow_request(), equal_to(False))
+
+    def test_half_open_probe_success_closes(self):
+        [self._class.record_failure() for _ in range(3)]
+        self.clock.now = 61
+        self._class.allow_request()
+        self._class.record_success()
+        assert_that(self._class.state, equal_to(CircuitBreaker.CLOSED))
+
+    def test_cancelled_probe_is_released(self):
+        [self._class.record_failure() for _ in range(3)]
+        self.clock.now = 61
+        assert_that(self._class.allow_request(), equal_to(True))
+        self._class.release_probe()
+        assert_that(self._class.state, equal_to(CircuitBreaker.HALF_OPEN))
+        assert_that(self._class.allow_request(), equal_to(True))
+
+
+class CircuitBreakerRegistryTester(unittest.TestCase):
+    def test_available_skips_open(self):
+        clock = FakeClock()
+        registry = CircuitBreakerRegistry(failure_threshold=1, cool_down=10, clock=clock)
+        registry.get('b').record_failure()
+        assert_that(registry.available(['a', 'b', 'c']), equal_to(['a', 'c']))
+        clock.now = 10
+        assert_that(registry.available(['a', 'b', 'c']), equal_to(['a', 'b', 'c']))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+
+from hamcrest import *
+from d_torrent_to_download.concurrency import AdaptiveConcurrency
+from d_torrent_to_download.scheduler import DownloadScheduler
+
+
+class AdaptiveConcurrencyTester(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.
+        self.scheduler = DownloadScheduler(limit=4)
+        self._class = AdaptiveConcurrency(self.scheduler, minimum=2, maximum=6, interval=10, clock=lambda: self.now)
+
+    def _window(self, amount, results=(), active=None):
+        self.scheduler.active = self.scheduler.limit if active is None else active
+        [self._class.record_result(success) for success in results]
+        self._class.record_bytes(amount)
+        self.now += 10
+        self._class.update()
+
+    def test_additive_increase(self):
+        self._window(100)
+        self._window(100)
+        assert_that(self._class.limit, equal_to(6))
+        self._window(100)
+        assert_that(self._class.limit, equal_to(6))
+
+    def test_idle_slots(self):
+        self._window(100, active=1)
+        self._window(10, active=1)
+        assert_that(self._class.limit, equal_to(4))
+
+    def test_decrease_on_errors(self):
+        self._window(100, results=[True, False, False])
+        assert_that(self._class.limit, equal_to(2))
+        self._window(100, results=[False])
+        assert_that(self._class.limit, equal_to(2))
+
+    def test_decrease_on_throughput_drop(self):
+        self._window(1000)
+        self._window(500)
+        assert_that(self._class.limit, equal_to(2))
+
+    def test_windows_close_without_bytes(self):
+        event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(event_loop)
+        self.scheduler.active = 6
+        controller = AdaptiveConcurrency(self.scheduler, minimum=2, maximum=6, interval=.01)
+        controller.start()
+        event_loop.run_until_complete(asyncio.sleep(.1))
+        event_loop.run_until_complete(controller.close())
+        event_loop.close()
+        assert_that(controller.limit, equal_to(6))
+
+    def test_bounds(self):
+        scheduler = DownloadScheduler(limit=15)
+        assert_that(AdaptiveConcurrency(scheduler, minimum=2, maximum=6).limit, equal_to(6))
+
+
+if __name__ == "__main__":
+    unittest.main()
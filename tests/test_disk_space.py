@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import asyncio
+import tempfile
+import unittest
+from collections import namedtuple
+
+from hamcrest import *
+from d_torrent_to_download.disk_space import DiskSpaceAdmission, NotEnoughDiskSpace, parse_size
+
+Usage = namedtuple('Usage', ['total', 'used', 'free'])
+
+
+class DiskSpaceAdmissionTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name + '/Supergirl [tt4016454]/Season 2/Supergirl.S02E13.mkv'
+        self._class = DiskSpaceAdmission(margin=10, disk_usage=lambda path: Usage(1000, 900, 100))
+
+    def test_parse_size(self):
+        assert_that([parse_size('4096'), parse_size('500M'), parse_size('1.5G'), parse_size('2TiB')],
+                    equal_to([4096, 500 << 20, 3 << 29, 2 << 40]))
+        self.assertRaises(ValueError, parse_size, '2M/s')
+
+    def test_reserve(self):
+        assert_that(self.event_loop.run_until_complete(self._class.reserve(self.path, 60)), equal_to(True))
+        assert_that(self._class.get_available(self.path), equal_to(30))
+        self.event_loop.run_until_complete(self._class.release(self.path, 60))
+        assert_that(self._class.get_available(self.path), equal_to(90))
+
+    def test_never_fits(self):
+        self.assertRaises(NotEnoughDiskSpace, self.event_loop.run_until_complete, self._class.reserve(self.path, 95))
+
+    def test_deferred(self):
+        order = []
+
+        async def download(name, size):
+            assert_that(await self._class.reserve(self.path, size), equal_to(True))
+            order.append(name)
+            await asyncio.sleep(0.01)
+            order.append(name + ' done')
+            await self._class.release(self.path, size)
+
+        self.event_loop.run_until_complete(asyncio.gather(download('a', 60), download('b', 60)))
+        assert_that(order, equal_to(['a', 'a done', 'b', 'b done']))
+
+    def tearDown(self):
+        self.event_loop.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import asyncio
+import itertools
+import unittest
+from unittest.mock import MagicMock
+
+from hamcrest import *
+from d_torrent_to_download.downloader_pool import DownloaderPool
+
+IDS = itertools.count()
+
+
+class FakeAccount:
+    def __init__(self, quota=None, working=True):
+        self.quota = quota
+        self.working = working
+        self.transfers = {}
+        self.calls = []
+
+    async def upload(self, link):
+        self.calls.append('upload')
+        transfer = MagicMock(id=next(IDS), progress=0., spec=['id', 'progress', 'name'])
+        self.transfers[transfer.id] = transfer
+        return transfer
+
+    async def get_quota(self):
+        return self.quota
+
+    async def get_transfers(self):
+        return list(self.transfers.values())
+
+    async def get_file_from_transfer(self, transfer):
+        assert transfer.id in self.transfers
+        return MagicMock(spec=['name', 'link'])
+
+    async def download_file(self, file_, download_directory):
+        self.calls.append('download_file')
+        return True
+
+    async def delete(self, transfer):
+        self.calls.append('delete')
+        self.transfers.pop(transfer.id)
+
+    async def close(self):
+        self.calls.append('close')
+
+    def __bool__(self):
+        return self.working
+
+
+class DownloaderPoolTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.accounts = [FakeAccount(quota=10), FakeAccount(quota=50), FakeAccount(quota=0)]
+        self._class = DownloaderPool(self.accounts)
+
+    def _upload(self, count):
+        return [self.event_loop.run_until_complete(self._class.upload('magnet:{}'.format(i))) for i in range(count)]
+
+    def test_load_balancing(self):
+        transfers = self._upload(4)
+        # Most quota first, then by active transfers, never the account without quota
+        assert_that([t.account for t in transfers], equal_to([1, 0, 1, 0]))
+        assert_that(self.accounts[2].calls, equal_to([]))
+
+    def test_routing(self):
+        transfer = self._upload(2)[1]
+        file_ = self.event_loop.run_until_complete(self._class.get_file_from_transfer(transfer))
+        self.event_loop.run_until_complete(self._class.download_file(file_, '/tmp'))
+        self.event_loop.run_until_complete(self._class.delete(transfer))
+        assert_that(self.accounts[0].calls, equal_to(['upload', 'download_file', 'delete']))
+        assert_that(self.accounts[1].calls, equal_to(['upload']))
+
+    def test_get_transfers(self):
+        self._upload(3)
+        list(self.accounts[1].transfers.values())[0].progress = 1.
+        transfers = self.event_loop.run_until_complete(self._class.get_transfers())
+        assert_that(sorted(t.account for t in transfers), equal_to([0, 1, 1]))
+        assert_that([len(active) for active in self._class.active], equal_to([1, 1, 0]))
+
+    def test_unusable_account(self):
+        accounts = [FakeAccount(working=False), FakeAccount()]
+        pool = DownloaderPool(accounts)
+        assert_that(bool(pool), equal_to(True))
+        assert_that(self.event_loop.run_until_complete(pool.upload('magnet:x')).account, equal_to(0))
+        self.event_loop.run_until_complete(pool.close())
+        assert_that([a.calls[-1] for a in accounts], equal_to(['close', 'close']))
+        assert_that(bool(DownloaderPool([FakeAccount(working=False)])), equal_to(False))
+
+    def tearDown(self):
+        self.event_loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
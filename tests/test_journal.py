@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from hamcrest import *
+from a_argument_to_show.thetvdb_api import TheTVDBAPI, TVDBShow, Episode
+from c_status_to_torrent.status2torrent import Torrent
+from d_torrent_to_download.journal import JobJournal
+
+LINK = 'magnet:?xt=urn:btih:430ae2f38babd312fa535ef7f02c728318fe1782&dn=Supergirl.S02E13'
+
+
+class JobJournalTester(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'journal.sqlite')
+        self._class = JobJournal(self.path)
+
+        self.show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759}, TheTVDBAPI(test=True))
+        self.show.imdb_id = 'tt4016454'
+        self.episode = Episode(self.show, {'airedSeason': 2, 'airedEpisodeNumber': 13, 'episodeName': 'Luthors'})
+        self.torrent = Torrent.from_links(self.episode, [LINK])
+
+    def test_lifecycle(self):
+        self._class.record_searched(self.show, self.torrent)
+        assert_that(self._class.get(self.show, self.episode)['state'], equal_to(JobJournal.SEARCHED))
+        self._class.record_uploaded(self.show, self.episode, MagicMock(id=42))
+        self._class.record_downloading(self.show, self.episode, '/tmp/x.mkv', 1000)
+        job = self._class.get(self.show, self.episode)
+        assert_that((job['state'], job['transfer_id'], job['bytes_written']),
+                    equal_to((JobJournal.DOWNLOADING, '42', 1000)))
+        self._class.record_done(self.show, self.episode)
+        assert_that(self._class.get_pending(self.show), equal_to([]))
+
+    def test_searched_keeps_progress(self):
+        self._class.record_searched(self.show, self.torrent)
+        self._class.record_uploaded(self.show, self.episode, MagicMock(id=42))
+        self._class.record_searched(self.show, Torrent.from_links(self.episode, ['magnet:other']))
+        job = self._class.get(self.show, self.episode)
+        assert_that((job['state'], job['transfer_id']), equal_to((JobJournal.UPLOADED, '42')))
+
+    def test_failed_is_searched_again(self):
+        self._class.record_searched(self.show, self.torrent)
+        self._class.record_uploaded(self.show, self.episode, MagicMock(id=42))
+        self._class.record_failed(self.show, self.episode)
+        assert_that(self._class.get_pending(self.show), equal_to([]))
+        self._class.record_searched(self.show, Torrent.from_links(self.episode, ['magnet:other']))
+        job = self._class.get(self.show, self.episode)
+        assert_that((job['state'], job['links'], job['transfer_id']),
+                    equal_to((JobJournal.SEARCHED, '["magnet:other"]', None)))
+
+    def test_persistent(self):
+        self._class.record_searched(self.show, self.torrent)
+        self._class.record_uploaded(self.show, self.episode, MagicMock(id=42))
+        self._class.close()
+
+        self._class = JobJournal(self.path)
+        pending = self._class.get_pending(self.show)
+        assert_that([(job['reference'], job['transfer_id']) for job in pending], equal_to([('s02e13', '42')]))
+
+    def test_file_hash(self):
+        path = os.path.join(self.temp_dir.name, 'Supergirl.S02E13.mkv')
+        assert_that(self._class.get_file_hash(path), equal_to(None))
+        self._class.record_file_hash(self.show, self.episode, path, 'sha256-pieces:16777216', 'ab' * 32)
+        assert_that(self._class.get_file_hash(path), equal_to(('sha256-pieces:16777216', 'ab' * 32)))
+
+    def tearDown(self):
+        self._class.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
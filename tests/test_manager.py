@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+
+from hamcrest import *
+from manager import ShowManager
+
+
+class ShowManagerTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self._class = ShowManager.__new__(ShowManager)
+        self._class.download_directory = ''
+        self._class.journal = None
+        self._class.show2status = MagicMock(analyse=lambda information: ['s02e13'])
+        self.searched = []
+
+        async def iter_torrents(information):
+            for i in range(100):
+                self.searched.append(i)
+                yield MagicMock()
+
+        async def download_queue(information, queue):
+            # Shut down after the first torrent
+            await queue.get()
+
+        self._class.status2torrent = MagicMock(iter_torrents=iter_torrents)
+        self._class.torrent2download = MagicMock(download_queue=download_queue)
+
+    def test_search_stops_with_the_downloads(self):
+        self.event_loop.run_until_complete(asyncio.wait_for(self._class._workflow(MagicMock()), 1))
+        assert_that(len(self.searched), less_than_or_equal_to(ShowManager.TORRENT_QUEUE + 2))
+
+    def tearDown(self):
+        self.event_loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
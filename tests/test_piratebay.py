@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import asyncio
+import datetime
+import unittest
+
+from aiohttp import web
+from hamcrest import *
+from c_status_to_torrent.circuit_breaker import CircuitBreaker
+from c_status_to_torrent.piratebay import PirateBayParser, PirateBayResult, PiratebayGrabber
+from tests.test_mocks_data import PIRATEBAY_RESPONSE_SHORTENED
+
+TODAY = datetime.date(2017, 3, 1)
+
+
+class PirateBayResultTester(unittest.TestCase):
+    def setUp(self):
+        self._class = PirateBayParser.parse_piratebay_response(PIRATEBAY_RESPONSE_SHORTENED)[0]
+
+    def test_parse_row(self):
+        assert_that(self._class.title, equal_to('Supergirl.S02E13.HDTV.x264-LOL[ettv]'))
+        assert_that(self._class.seeders, equal_to(1493))
+        assert_that(self._class.size, equal_to(int(280.6 * (1 << 20))))
+        assert_that(self._class.uploaded, is_not(None))
+
+    def test_dict_roundtrip(self):
+        result = PirateBayResult.from_dict(self._class.to_dict())
+        assert_that(result.to_dict(), equal_to(self._class.to_dict()))
+
+    def test_parse_description(self):
+        uploaded, size = PirateBayResult.parse_description(
+            'Uploaded 02-21\xa003:03, Size 1.4\xa0GiB, ULed by ettv', today=TODAY)
+        assert_that(uploaded, equal_to(datetime.date(2017, 2, 21)))
+        assert_that(size, equal_to(int(1.4 * (1 << 30))))
+
+    def test_parse_upload_dates(self):
+        assert_that(PirateBayResult.parse_upload_date('Today 03:03', today=TODAY), equal_to(TODAY))
+        assert_that(PirateBayResult.parse_upload_date('Y-day 03:03', today=TODAY),
+                    equal_to(datetime.date(2017, 2, 28)))
+        assert_that(PirateBayResult.parse_upload_date('12 mins ago', today=TODAY), equal_to(TODAY))
+        assert_that(PirateBayResult.parse_upload_date('05-21 2015', today=TODAY), equal_to(datetime.date(2015, 5, 21)))
+        assert_that(PirateBayResult.parse_upload_date('12-24 13:37', today=TODAY),
+                    equal_to(datetime.date(2016, 12, 24)))
+
+
+class OfflineGrabber(PiratebayGrabber):
+    def setup_proxies(self):
+        return []
+
+
+class FakeShow:
+    @staticmethod
+    def get_search_query():
+        return 'Supergirl'
+
+
+class FakeEpisode:
+    date = TODAY
+
+    @staticmethod
+    def str_short():
+        return 's02e13'
+
+
+class PiratebayGrabberTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.requests = 0
+        self.delay = 0
+
+        async def handle(request):
+            self.requests += 1
+            await asyncio.sleep(self.delay)
+            return web.Response(status=503)
+
+        app = web.Application()
+        app.router.add_post('/search/{tail:.*}', handle)
+        self.runner = web.AppRunner(app)
+        self.event_loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.event_loop.run_until_complete(site.start())
+        self.proxy = 'http://127.0.0.1:{}'.format(site._server.sockets[0].getsockname()[1])
+        self._class = OfflineGrabber(self.event_loop, failure_threshold=2, cache_path='')
+        self._class.proxies = [self.proxy]
+
+    def test_one_failure_per_request(self):
+        assert_that(self.event_loop.run_until_complete(self._class.search(FakeShow(), FakeEpisode())), equal_to([]))
+        assert_that(self.requests, equal_to(3))
+        breaker = self._class.circuit_breakers.get(self.proxy)
+        assert_that((breaker.failures, breaker.state), equal_to((1, CircuitBreaker.CLOSED)))
+
+    def test_cancelled_probe(self):
+        breaker = self._class.circuit_breakers.get(self.proxy)
+        [breaker.record_failure() for _ in range(2)]
+        breaker.opened_at -= self._class.circuit_breakers.cool_down
+        self.delay = 1
+        task = self.event_loop.create_task(self._class.search(FakeShow(), FakeEpisode()))
+        self.event_loop.run_until_complete(asyncio.sleep(.1))
+        assert_that(breaker.probing, equal_to(True))
+        task.cancel()
+        self.event_loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+        assert_that((breaker.state, breaker.probing), equal_to((CircuitBreaker.HALF_OPEN, False)))
+        assert_that(breaker.allow_request(), equal_to(True))
+
+    def tearDown(self):
+        self.event_loop.run_until_complete(self._class.close())
+        self.event_loop.run_until_complete(self.runner.cleanup())
+        self.event_loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+
+from aiohttp import web
+from hamcrest import *
+from d_torrent_to_download.premiumize import PremiumizeMe
+
+HASH = '430ae2f38babd312fa535ef7f02c728318fe1782'
+HASH_2 = '530ae2f38babd312fa535ef7f02c728318fe1782'
+
+
+class PremiumizeMeTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.queries = []
+
+        async def handle(request):
+            self.queries.append(request.query)
+            if request.query.get('pin') != 'pin':
+                return web.json_response({'status': 'error', 'message': 'Not logged in.'})
+            return web.json_response({'status': 'success',
+                                      'response': [item == HASH for item in request.query.getall('items[]')]})
+
+        async def handle_account_info(request):
+            if request.query.get('pin') != 'pin':
+                return web.json_response({'status': 'error', 'message': 'Not logged in.'})
+            return web.json_response({'status': 'success', 'customer_id': 1234, 'limit_used': 0.25})
+
+        app = web.Application()
+        app.router.add_get('/api/cache/check', handle)
+        app.router.add_get('/api/account/info', handle_account_info)
+        self.runner = web.AppRunner(app)
+        self.event_loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.event_loop.run_until_complete(site.start())
+        self.url = 'http://127.0.0.1:{}/api/'.format(site._server.sockets[0].getsockname()[1])
+        self._class = self._get_class('1234:pin')
+
+    def _get_class(self, login):
+        premiumize = PremiumizeMe(login, self.event_loop)
+        premiumize.CACHE_CHECK_URL = self.url + 'cache/check'
+        premiumize.ACCOUNT_INFO_URL = self.url + 'account/info'
+        return premiumize
+
+    def test_check_cache(self):
+        assert_that(self.event_loop.run_until_complete(self._class.check_cache([HASH, HASH_2])), equal_to([HASH]))
+        assert_that(self.queries[0].get('customer_id'), equal_to('1234'))
+        assert_that(self.queries[0].getall('items[]'), equal_to([HASH, HASH_2]))
+
+    def test_failed_check_is_no_cache(self):
+        premiumize = self._get_class('1234:wrong')
+        assert_that(self.event_loop.run_until_complete(premiumize.check_cache([HASH])), equal_to([]))
+        self.event_loop.run_until_complete(premiumize.close())
+
+    def test_quota(self):
+        assert_that(self.event_loop.run_until_complete(self._class.get_quota()), equal_to(0.75))
+
+    def test_failed_quota_is_unknown(self):
+        premiumize = self._get_class('1234:wrong')
+        assert_that(self.event_loop.run_until_complete(premiumize.get_quota()), none())
+        self.event_loop.run_until_complete(premiumize.close())
+
+    def tearDown(self):
+        self.event_loop.run_until_complete(self._class.close())
+        self.event_loop.run_until_complete(self.runner.cleanup())
+        self.event_loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
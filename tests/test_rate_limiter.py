@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+
+from hamcrest import *
+from c_status_to_torrent.rate_limiter import TokenBucket, HostRateLimiterRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTester(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self._class = TokenBucket(2, 4, clock=self.clock)
+
+    def test_burst(self):
+        assert_that([self._class.try_consume() for _ in range(5)], equal_to([True] * 4 + [False]))
+
+    def test_refill(self):
+        [self._class.try_consume() for _ in range(4)]
+        self.clock.now = 1
+        assert_that(self._class.try_consume(2), equal_to(True))
+        assert_that(self._class.try_consume(), equal_to(False))
+
+    def test_refill_capped_at_burst(self):
+        self.clock.now = 100
+        assert_that(self._class.try_consume(5), equal_to(False))
+        assert_that(self._class.time_until_available(), equal_to(0))
+
+    def test_wait_time(self):
+        [self._class.try_consume() for _ in range(4)]
+        assert_that(self._class.time_until_available(3), close_to(1.5, 0.001))
+
+
+class HostRateLimiterRegistryTester(unittest.TestCase):
+    def test_per_host(self):
+        registry = HostRateLimiterRegistry()
+        assert_that(registry.get('https://a.org/search/x'), same_instance(registry.get('https://a.org/top')))
+        assert_that(registry.get('https://a.org/'), is_not(same_instance(registry.get('https://b.org/'))))
+
+    def test_concurrency(self):
+        limiter = HostRateLimiterRegistry(requests_per_second=1000, burst=10, concurrency=2).get('http://a.org')
+        active, peak = [0], [0]
+
+        async def request():
+            async with limiter:
+                await limiter.throttle()
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                await asyncio.sleep(.01)
+                active[0] -= 1
+
+        async def run():
+            await asyncio.gather(*[request() for _ in range(6)])
+
+        asyncio.run(run())
+        assert_that(peak[0], equal_to(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from hamcrest import *
+from a_argument_to_show.release_name import parse_release_name, index_by_episode
+
+
+class ReleaseNameTester(unittest.TestCase):
+    def test_episode(self):
+        release = parse_release_name('Supergirl.S02E13.HDTV.x264-LOL[ettv]')
+        assert_that(release.show_tokens, equal_to(('supergirl',)))
+        assert_that(release.get_keys(), equal_to([(2, 13)]))
+        assert_that(release.quality, equal_to('hdtv'))
+        assert_that(release.codec, equal_to('x264'))
+
+    def test_episode_range(self):
+        release = parse_release_name('Supergirl.S02E13-E14.720p.WEB-DL.H.264')
+        assert_that(release.episodes, equal_to((13, 14)))
+        assert_that(release.quality, equal_to('720p'))
+        assert_that(release.codec, equal_to('x264'))
+
+    def test_x_notation(self):
+        release = parse_release_name('Doctor Who 2005 - 10x05 - Oxygen 1080p HEVC.mkv')
+        assert_that(release.get_keys(), equal_to([(10, 5)]))
+        assert_that(release.codec, equal_to('x265'))
+
+    def test_short_x_notation(self):
+        assert_that(parse_release_name('Supergirl 2x5 Crossfire.avi').get_keys(), equal_to([(2, 5)]))
+
+    def test_resolution_is_no_episode(self):
+        for title in ['Show 1920x1080', 'Show 720x480']:
+            assert_that(parse_release_name(title).get_keys(), equal_to([]))
+
+    def test_codec_is_no_episode(self):
+        release = parse_release_name('Supergirl S02 DD5.1x264')
+        assert_that(release.is_season_pack, equal_to(True))
+        assert_that(release.get_keys(), equal_to([(2, None)]))
+        assert_that(parse_release_name('Supergirl 720p DD5.1x264').get_keys(), equal_to([]))
+
+    def test_quality_is_no_episode_range(self):
+        assert_that(parse_release_name('Show S01E01 720p').episodes, equal_to((1,)))
+
+    def test_season_pack(self):
+        for title in ['Supergirl S02 Complete 720p', 'Supergirl.Season.2.x265']:
+            release = parse_release_name(title)
+            assert_that(release.is_season_pack, equal_to(True))
+            assert_that(release.get_keys(), equal_to([(2, None)]))
+
+    def test_season_range(self):
+        for title in ['Show.S01-S03.complete', 'Show Season 1-3 720p']:
+            release = parse_release_name(title)
+            assert_that(release.is_season_pack, equal_to(True))
+            assert_that(release.get_keys(), equal_to([(1, None), (2, None), (3, None)]))
+
+    def test_index(self):
+        index = index_by_episode(['Supergirl s02e01 a.mkv', 'Supergirl s02e02 b.mkv', 'notes.txt'])
+        assert_that(sorted(index.keys()), equal_to([(2, 1), (2, 2)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
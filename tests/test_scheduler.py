@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import asyncio
+import datetime
+import unittest
+from unittest.mock import MagicMock
+
+from hamcrest import *
+from d_torrent_to_download.scheduler import DownloadScheduler
+
+
+def get_reference(days_ago):
+    return MagicMock(spec=['date'], date=datetime.date.today() - datetime.timedelta(days=days_ago))
+
+
+class DownloadSchedulerTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self._class = DownloadScheduler(limit=2, per_show=1)
+
+    def test_get_priority(self):
+        season = MagicMock(spec=['episodes'], episodes=[get_reference(400), get_reference(30)])
+        assert_that([self._class.get_priority(get_reference(1)), self._class.get_priority(season),
+                     self._class.get_priority(get_reference(400))],
+                    equal_to([DownloadScheduler.NEW, DownloadScheduler.RECENT, DownloadScheduler.BACKFILL]))
+
+    def _run(self, jobs):
+        started = []
+
+        async def job(show, reference, name):
+            async with self._class.slot(show, reference):
+                started.append(name)
+                await asyncio.sleep(0.01)
+
+        self.event_loop.run_until_complete(asyncio.gather(*[job(*j) for j in jobs]))
+        return started
+
+    def test_priority_order(self):
+        self._class.limit = 1
+        started = self._run([('a', get_reference(400), 'first'), ('b', get_reference(400), 'backfill'),
+                             ('c', get_reference(30), 'recent'), ('d', get_reference(1), 'new')])
+        assert_that(started, equal_to(['first', 'new', 'recent', 'backfill']))
+
+    def test_per_show_cap(self):
+        started = self._run([('a', get_reference(1), 'a1'), ('a', get_reference(1), 'a2'),
+                             ('b', get_reference(400), 'b1')])
+        assert_that(started, equal_to(['a1', 'b1', 'a2']))
+        assert_that(self._class.active, equal_to(0))
+
+    def test_limit(self):
+        self._class.per_show = 10
+        running = []
+
+        async def job():
+            async with self._class.slot('a', get_reference(1)):
+                running.append(self._class.active)
+                await asyncio.sleep(0.01)
+
+        self.event_loop.run_until_complete(asyncio.gather(*[job() for _ in range(6)]))
+        assert_that(max(running), equal_to(2))
+
+    def tearDown(self):
+        self.event_loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import tempfile
+import unittest
+
+from hamcrest import *
+from c_status_to_torrent.search_cache import SearchCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000000
+
+    def __call__(self):
+        return self.now
+
+
+class SearchCacheTester(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'cache.json')
+        self.clock = FakeClock()
+        self._class = SearchCache(path=self.path, clock=self.clock)
+
+    def test_normalized_key(self):
+        self._class.put('Supergirl  s02e13', [{'title': 'Supergirl.S02E13'}])
+        assert_that(self._class.get(' supergirl S02E13'), equal_to([{'title': 'Supergirl.S02E13'}]))
+
+    def test_miss(self):
+        assert_that(self._class.get('Supergirl s02e13'), none())
+
+    def test_empty_result_is_cached(self):
+        self._class.put('Supergirl s02e13', [], aired=datetime.date(2017, 2, 20))
+        assert_that(self._class.get('Supergirl s02e13'), equal_to([]))
+
+    def test_ttl_recent_shorter_than_old(self):
+        recent = self._class.get_ttl([], aired=datetime.date.today())
+        old = self._class.get_ttl([], aired=datetime.date(2017, 2, 20))
+        assert_that(recent, less_than(old))
+
+    def test_expiry(self):
+        self._class.put('Supergirl s02e13', [], aired=datetime.date.today())
+        self.clock.now += SearchCache.TTL['empty_recent'].total_seconds() + 1
+        assert_that(self._class.get('Supergirl s02e13'), none())
+
+    def test_persistence(self):
+        self._class.put('Supergirl s02e13', [{'title': 'Supergirl.S02E13'}])
+        self._class.save()
+        reloaded = SearchCache(path=self.path, clock=self.clock)
+        assert_that(reloaded.get('Supergirl s02e13'), equal_to([{'title': 'Supergirl.S02E13'}]))
+
+    def test_saved_periodically(self):
+        self._class.put('Supergirl s02e13', [{'title': 'Supergirl.S02E13'}])
+        assert_that(os.path.exists(self.path), equal_to(False))
+        self.clock.now += SearchCache.SAVE_INTERVAL
+        self._class.put('Supergirl s02e14', [])
+        reloaded = SearchCache(path=self.path, clock=self.clock)
+        assert_that(reloaded.get('Supergirl s02e13'), equal_to([{'title': 'Supergirl.S02E13'}]))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import asyncio
+import errno
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from aiohttp import web
+from hamcrest import *
+from d_torrent_to_download.disk_space import DiskSpaceAdmission, NotEnoughDiskSpace
+from d_torrent_to_download.segmented_download import SegmentedDownloader, hash_file
+
+CONTENT = bytes(range(256)) * 4096
+PIECE_SIZE = 3 << 14
+
+
+class SegmentedDownloaderTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'Supergirl.S02E13.mkv')
+        self.range_requests = []
+
+        async def handle(request):
+            self.range_requests.append(request.headers.get('Range'))
+            if request.headers.get('Range'):
+                start, end = map(int, request.headers['Range'][len('bytes='):].split('-'))
+                return web.Response(status=206, body=CONTENT[start:end + 1])
+            return web.Response(body=CONTENT, headers={'Accept-Ranges': 'bytes'})
+
+        app = web.Application()
+        app.router.add_route('*', '/file', handle)
+        self.runner = web.AppRunner(app)
+        self.event_loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.event_loop.run_until_complete(site.start())
+        self.url = 'http://127.0.0.1:{}/file'.format(site._server.sockets[0].getsockname()[1])
+
+        self._class = SegmentedDownloader(self.event_loop, segments=4, chunk_size=1 << 16, min_segment_size=1 << 16,
+                                          piece_size=PIECE_SIZE)
+
+    def test_segmented(self):
+        hashes = []
+        assert_that(self.event_loop.run_until_complete(self._class.download(self.url, self.path,
+                                                                            on_hash=hashes.append)), equal_to(True))
+        with open(self.path, 'rb') as f:
+            assert_that(f.read() == CONTENT, equal_to(True))
+        assert_that(hashes, equal_to([hash_file(self.path, PIECE_SIZE)]))
+        assert_that(len([r for r in self.range_requests if r]), equal_to(4))
+        assert_that(os.path.exists(self.path + SegmentedDownloader.PART_SUFFIX), equal_to(False))
+        assert_that(os.path.exists(self.path + SegmentedDownloader.STATE_SUFFIX), equal_to(False))
+
+    def test_write_buffer(self):
+        # Flushes do not line up with chunks or pieces
+        self._class.write_buffer = 5 << 14
+        hashes = []
+        assert_that(self.event_loop.run_until_complete(self._class.download(self.url, self.path,
+                                                                            on_hash=hashes.append)), equal_to(True))
+        with open(self.path, 'rb') as f:
+            assert_that(f.read() == CONTENT, equal_to(True))
+        assert_that(hashes, equal_to([hash_file(self.path, PIECE_SIZE)]))
+
+    def test_resume(self):
+        # Stopped in the middle of the second piece of the first segment
+        half, written = len(CONTENT) // 2 // PIECE_SIZE * PIECE_SIZE, PIECE_SIZE + 100
+        with open(self.path + SegmentedDownloader.PART_SUFFIX, 'wb') as f:
+            f.write(CONTENT[:written] + bytes(len(CONTENT) - written))
+        with open(self.path + SegmentedDownloader.STATE_SUFFIX, 'w') as f:
+            json.dump({'size': len(CONTENT), 'piece_size': PIECE_SIZE,
+                       'pieces': {'0': hashlib.sha256(CONTENT[:PIECE_SIZE]).hexdigest()},
+                       'segments': [[0, half, written], [half, len(CONTENT), 0]]}, f)
+
+        hashes = []
+        assert_that(self.event_loop.run_until_complete(self._class.download(self.url, self.path,
+                                                                            on_hash=hashes.append)), equal_to(True))
+        with open(self.path, 'rb') as f:
+            assert_that(f.read() == CONTENT, equal_to(True))
+        assert_that([r for r in self.range_requests if r],
+                    contains_inanyorder('bytes={}-{}'.format(written, half - 1),
+                                        'bytes={}-{}'.format(half, len(CONTENT) - 1)))
+        assert_that(hashes, equal_to([hash_file(self.path, PIECE_SIZE)]))
+
+    def test_intact_file_is_kept(self):
+        hashes = []
+        self.event_loop.run_until_complete(self._class.download(self.url, self.path, on_hash=hashes.append))
+        self.range_requests = []
+        assert_that(self.event_loop.run_until_complete(self._class.download(self.url, self.path,
+                                                                            known_hash=hashes[0])), equal_to(True))
+        assert_that(self.range_requests, equal_to([]))
+
+    def test_changed_file_is_downloaded_again(self):
+        hashes = []
+        self.event_loop.run_until_complete(self._class.download(self.url, self.path, on_hash=hashes.append))
+        with open(self.path, 'r+b') as f:
+            f.write(b'corrupted')
+        assert_that(self.event_loop.run_until_complete(self._class.download(self.url, self.path,
+                                                                            known_hash=hashes[0])), equal_to(True))
+        with open(self.path, 'rb') as f:
+            assert_that(f.read() == CONTENT, equal_to(True))
+
+    def test_no_disk_space(self):
+        self._class.admission = DiskSpaceAdmission(margin=0, disk_usage=lambda path: MagicMock(free=len(CONTENT) - 1))
+        self.assertRaises(NotEnoughDiskSpace, self.event_loop.run_until_complete,
+                          self._class.download(self.url, self.path))
+        assert_that(os.path.exists(self.path + SegmentedDownloader.PART_SUFFIX), equal_to(False))
+
+    def test_preallocated_file_is_not_reserved_twice(self):
+        def preallocate(path, size):
+            with open(path, 'wb') as f:
+                f.truncate(size)
+            return True
+
+        self._class.admission = DiskSpaceAdmission(margin=0, disk_usage=lambda path: MagicMock(free=len(CONTENT)))
+        self._class._preallocate = preallocate
+        reserved = []
+        self.event_loop.run_until_complete(self._class.download(
+            self.url, self.path,
+            on_progress=lambda done: reserved.append(sum(self._class.admission.reserved.values()))))
+        # The free space already counts the allocated file
+        assert_that(reserved, only_contains(0))
+
+    def test_write_error_fails_download(self):
+        def write(*args):
+            raise OSError(errno.ENOSPC, 'No space left on device')
+
+        self._class._write = write
+        assert_that(self.event_loop.run_until_complete(self._class.download(self.url, self.path)), equal_to(False))
+        assert_that(os.path.exists(self.path), equal_to(False))
+
+    def tearDown(self):
+        self.event_loop.run_until_complete(self._class.close())
+        self.event_loop.run_until_complete(self.runner.cleanup())
+        self.event_loop.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
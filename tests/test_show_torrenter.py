@@ -11,7 +11,10 @@ class ShowTorrenterTester(unittest.TestCase):
         self._class = STATUS2TORRENT_MOCK
 
     def test_get_torrent(self):
-        torrents = self._class.get_torrents(INFORMATION_MOCK)
+        async def consume():
+            return [torrent async for torrent in self._class.iter_torrents(INFORMATION_MOCK)]
+
+        torrents = self._class.torrent_grabber.event_loop.run_until_complete(consume())
         assert_that(len(torrents), equal_to(1))
         assert_that(torrents[0].links, equal_to(INFORMATION_MOCK.torrents[0].links))
         self._class.torrent_grabber.event_loop.close()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+import asyncio
+import itertools
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from hamcrest import *
+from a_argument_to_show.thetvdb_api import TheTVDBAPI, TVDBShow, Episode
+from c_status_to_torrent.status2torrent import Status2Torrent, Torrent, get_infohash
+from d_torrent_to_download.journal import JobJournal
+from d_torrent_to_download.torrent2download import DOWNLOADERS, Torrent2Download
+from manager import Information
+
+HASH = '430ae2f38babd312fa535ef7f02c728318fe1782'
+HASH_2 = '530ae2f38babd312fa535ef7f02c728318fe1782'
+
+
+def link(infohash, name):
+    return 'magnet:?xt=urn:btih:{}&dn={}&'.format(infohash, name)
+
+
+class FakeTransfer:
+    def __init__(self, transfer_id, link_):
+        self.id = transfer_id
+        self.name = link_
+        self.src = link_
+        self.hash = get_infohash(link_)
+        self.progress = 0.
+
+
+class FakeDownloader:
+    """ Transfers of links named "bad" fail, all others are finished at the first poll. Infohashes of "c" are cached """
+    def __init__(self, login, event_loop):
+        self.transfers = {}
+        self.ids = itertools.count()
+        self.uploaded, self.downloaded, self.deleted = [], [], []
+        self.polled = []
+        self.download_failures = 0
+        self.max_transfers = 0
+
+    async def upload(self, link_):
+        self.uploaded.append(link_)
+        transfer = FakeTransfer(next(self.ids), link_)
+        self.transfers[transfer.id] = transfer
+        self.max_transfers = max(self.max_transfers, len(self.transfers))
+        return transfer
+
+    def _update(self, transfer):
+        transfer.progress = 0. if 'bad' in transfer.name else 1.
+        self.polled.append(transfer.name)
+        return transfer
+
+    async def get_transfers(self):
+        return [self._update(transfer) for transfer in self.transfers.values()]
+
+    async def get_transfer(self, transfer):
+        return self._update(self.transfers[transfer.id]) if transfer.id in self.transfers else None
+
+    def is_transfer_finished(self, transfer, start_time):
+        if 'bad' in transfer.name:
+            return False
+        return True if transfer.progress >= 1 else None
+
+    async def check_cache(self, infohashes):
+        return [infohash for infohash in infohashes if infohash.startswith('c')]
+
+    async def download_transfer(self, transfer, download_directory):
+        if 'bad' in transfer.name:
+            return False
+        if self.download_failures:
+            self.download_failures -= 1
+            return False
+        self.downloaded.append(transfer.name)
+        return True
+
+    async def delete(self, transfer):
+        self.deleted.append(transfer.name)
+        self.transfers.pop(transfer.id, None)
+
+    async def close(self):
+        pass
+
+    def __bool__(self):
+        return True
+
+
+class NoProgressDownloader(FakeDownloader):
+    """ Transfers without a progress field, that never finish """
+    def _update(self, transfer):
+        transfer.__dict__.pop('progress', None)
+        self.polled.append(transfer.name)
+        return transfer
+
+    def is_transfer_finished(self, transfer, start_time):
+        return None
+
+
+class Torrent2DownloadTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        DOWNLOADERS['test'] = FakeDownloader
+        DOWNLOADERS['no progress'] = NoProgressDownloader
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759}, TheTVDBAPI(test=True))
+        self.episodes = [Episode(self.show, {'airedSeason': 2, 'airedEpisodeNumber': i, 'episodeName': str(i)})
+                         for i in (13, 14)]
+        [self.show._add_episode(episode) for episode in self.episodes]
+        self.information = Information(self.temp_dir.name)
+        self.information.show = self.show
+        self._class = None
+
+    def _get_class(self, downloader='test', **kwargs):
+        torrent2download = Torrent2Download(None, self.event_loop, segments=0, downloader=downloader, **kwargs)
+        poller = torrent2download.transfer_poller
+        poller.fast = poller.normal = poller.slow = poller.interval = .01
+        self._class = torrent2download
+        return torrent2download
+
+    def _download(self, torrent2download, torrents):
+        self.information.torrents = torrents
+        self.event_loop.run_until_complete(torrent2download.download(self.information))
+        return torrent2download.torrent_downloader
+
+    def test_fallback_of_failed_torrent(self):
+        status2torrent = Status2Torrent.__new__(Status2Torrent)
+        status2torrent.claims = {}
+        # s02e14 is dropped, as the best link of s02e13 satisfies it as well
+        torrents = status2torrent._deduplicate(self.show, [
+            Torrent.from_links(self.episodes[0], [link(HASH, 'bad')]),
+            Torrent.from_links(self.episodes[1], [link(HASH, 'bad'), link(HASH_2, 'good')])])
+        assert_that(len(torrents), equal_to(1))
+
+        downloader = self._download(self._get_class(get_fallbacks=status2torrent.get_fallbacks), torrents)
+        assert_that(downloader.uploaded, equal_to([link(HASH, 'bad'), link(HASH_2, 'good')]))
+        assert_that(downloader.downloaded, equal_to([link(HASH_2, 'good')]))
+
+    def test_failed_torrent_is_journaled(self):
+        journal = JobJournal(':memory:')
+        self._download(self._get_class(journal=journal), [Torrent.from_links(self.episodes[0], [link(HASH, 'bad')])])
+        assert_that(journal.get(self.show, self.episodes[0])['state'], equal_to(JobJournal.FAILED))
+        assert_that(journal.get_pending(self.show), equal_to([]))
+        journal.close()
+
+    def test_finished_downloads_are_forgotten(self):
+        torrent2download = self._get_class()
+        self._download(torrent2download, [Torrent.from_links(episode, [link(HASH, 'good')])
+                                          for episode in self.episodes])
+        assert_that(torrent2download.tasks, equal_to([]))
+
+    def test_known_hash_is_taken_from_the_journal(self):
+        journal = JobJournal(':memory:')
+        torrent2download = Torrent2Download(None, self.event_loop, downloader='test', journal=journal)
+        self._class = torrent2download
+        torrent2download._record_hash(self.information, self.episodes[0], 'a.mkv', 'ab' * 32)
+        journal.record_file_hash(self.show, self.episodes[1], 'b.mkv', 'sha256-pieces:1', 'cd' * 32)
+        assert_that(torrent2download._get_known_hash('a.mkv'), equal_to('ab' * 32))
+        # Hashed with another piece size, it can not be compared
+        assert_that(torrent2download._get_known_hash('b.mkv'), none())
+        journal.close()
+
+    def test_no_disk_space_leaves_the_job_pending(self):
+        journal = JobJournal(':memory:')
+        torrent2download = self._get_class(disk_margin=1 << 60, journal=journal)
+
+        async def get_files_from_transfer(transfer):
+            return [MagicMock(size=1 << 30)]
+        torrent2download.torrent_downloader.get_files_from_transfer = get_files_from_transfer
+        links = [link(HASH, 'good'), link(HASH_2, 'good')]
+        downloader = self._download(torrent2download, [Torrent.from_links(self.episodes[0], links)])
+        # Neither retried nor the next link uploaded, the transfer is kept to be resumed
+        assert_that(downloader.uploaded, equal_to(links[:1]))
+        assert_that(downloader.downloaded, equal_to([]))
+        assert_that(downloader.deleted, equal_to([]))
+        assert_that(journal.get(self.show, self.episodes[0])['state'], equal_to(JobJournal.DOWNLOADING))
+        journal.close()
+
+    def test_first_wins_keeps_first_finished(self):
+        links = [link(HASH, 'bad'), link(HASH_2, 'good'), link('a' * 40, 'good')]
+        downloader = self._download(self._get_class(parallel_links=2),
+                                    [Torrent.from_links(self.episodes[0], links)])
+        # Both of the best two links are uploaded at once, the third is never needed
+        assert_that(downloader.uploaded, equal_to(links[:2]))
+        assert_that(downloader.downloaded, equal_to([links[1]]))
+        assert_that(downloader.deleted, contains_inanyorder(*links[:2]))
+
+    def test_first_wins_next_links_after_all_failed(self):
+        links = [link(HASH, 'bad'), link(HASH_2, 'bad'), link('a' * 40, 'good')]
+        downloader = self._download(self._get_class(parallel_links=2),
+                                    [Torrent.from_links(self.episodes[0], links)])
+        assert_that(downloader.uploaded, equal_to(links))
+        assert_that(downloader.downloaded, equal_to([links[2]]))
+
+    def test_default_strategy(self):
+        assert_that(self._get_class().strategy, equal_to('queue'))
+        assert_that(self._get_class(parallel_links=2).strategy, equal_to('first-wins'))
+        assert_that(self._get_class(parallel_links=2, strategy='sequential').strategy, equal_to('sequential'))
+        assert_that(calling(self._get_class).with_args(strategy='fastest'), raises(ValueError))
+
+    def test_queued_next_link_after_failure(self):
+        links = [link(HASH, 'bad'), link(HASH_2, 'good')]
+        downloader = self._download(self._get_class(strategy='queue'), [Torrent.from_links(self.episodes[0], links)])
+        assert_that(downloader.uploaded, equal_to(links))
+        assert_that(downloader.downloaded, equal_to([links[1]]))
+        assert_that(downloader.deleted, equal_to(links))
+
+    def test_queued_transfers_are_bounded(self):
+        episodes = [Episode(self.show, {'airedSeason': 3, 'airedEpisodeNumber': i, 'episodeName': str(i)})
+                    for i in range(1, 9)]
+        [self.show._add_episode(episode) for episode in episodes]
+        torrents = [Torrent.from_links(episode, [link('{:040x}'.format(episode.episode), 'good')])
+                    for episode in episodes]
+        downloader = self._download(self._get_class(strategy='queue', concurrent_downloads=1, per_show_downloads=1),
+                                    torrents)
+        assert_that(len(downloader.downloaded), equal_to(len(episodes)))
+        assert_that(downloader.max_transfers, equal_to(Torrent2Download.QUEUED_TRANSFERS))
+
+    def test_download_is_retried(self):
+        torrent2download = self._get_class()
+        torrent2download.torrent_downloader.download_failures = Torrent2Download.DOWNLOAD_RETRIES - 1
+        downloader = self._download(torrent2download, [Torrent.from_links(self.episodes[0], [link(HASH, 'good')])])
+        assert_that(downloader.downloaded, equal_to([link(HASH, 'good')]))
+
+    def test_next_link_after_retries(self):
+        links = [link(HASH, 'good'), link(HASH_2, 'good')]
+        torrent2download = self._get_class()
+        torrent2download.torrent_downloader.download_failures = Torrent2Download.DOWNLOAD_RETRIES
+        downloader = self._download(torrent2download, [Torrent.from_links(self.episodes[0], links)])
+        assert_that(downloader.uploaded, equal_to(links))
+        assert_that(downloader.downloaded, equal_to([links[1]]))
+
+    def test_transfer_without_progress_stalls(self):
+        links = [link(HASH, 'good'), link(HASH_2, 'good')]
+        downloader = self._download(self._get_class(downloader='no progress', stall_timeout=.05),
+                                    [Torrent.from_links(self.episodes[0], links)])
+        # Each transfer is given up after the stall timeout, instead of waiting forever
+        assert_that(downloader.uploaded, equal_to(links))
+        assert_that(downloader.deleted, equal_to(links))
+        assert_that(downloader.downloaded, equal_to([]))
+
+    def test_cached_transfer_is_awaited(self):
+        links = [link(HASH, 'good'), link('c' * 40, 'good')]
+        downloader = self._download(self._get_class(), [Torrent.from_links(self.episodes[0], links)])
+        # The cached link goes first, and is downloaded once its transfer is seen finished
+        assert_that(downloader.uploaded, equal_to([links[1]]))
+        assert_that(downloader.polled, has_item(links[1]))
+        assert_that(downloader.downloaded, equal_to([links[1]]))
+
+    def test_failed_cached_transfer_is_deleted(self):
+        links = [link('c' * 40, 'bad'), link(HASH, 'good')]
+        downloader = self._download(self._get_class(), [Torrent.from_links(self.episodes[0], links)])
+        assert_that(downloader.uploaded, equal_to(links))
+        assert_that(downloader.deleted, equal_to(links))
+        assert_that(downloader.downloaded, equal_to([links[1]]))
+
+    def tearDown(self):
+        if self._class is not None:
+            self.event_loop.run_until_complete(self._class.close())
+        self.event_loop.close()
+        self.temp_dir.cleanup()
+        DOWNLOADERS.pop('test')
+        DOWNLOADERS.pop('no progress')
+
+
+if __name__ == "__main__":
+    unittest.main()
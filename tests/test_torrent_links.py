@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+import asyncio
+import datetime
+import unittest
+from unittest.mock import MagicMock
+
+from hamcrest import *
+from a_argument_to_show.thetvdb_api import TheTVDBAPI, TVDBShow, Episode
+from c_status_to_torrent.piratebay import PirateBayResult
+from c_status_to_torrent.status2torrent import Status2Torrent, Torrent, get_infohash
+
+HASH = '430ae2f38babd312fa535ef7f02c728318fe1782'
+HASH_2 = '530ae2f38babd312fa535ef7f02c728318fe1782'
+
+
+def result(infohash, name='Supergirl.S02E13.HDTV.x264-LOL'):
+    return PirateBayResult.from_dict({'title': name,
+                                      'magnet': 'magnet:?xt=urn:btih:{}&dn={}&tr=udp'.format(infohash, name)})
+
+
+class InfohashTester(unittest.TestCase):
+    def test_hex(self):
+        assert_that(get_infohash('magnet:?xt=urn:btih:{}&dn=x'.format(HASH.upper())), equal_to(HASH))
+
+    def test_base32(self):
+        assert_that(get_infohash('magnet:?xt=urn:btih:IMFOF44LVPJRF6STL337ALDSQMMP4F4C&dn=x'), equal_to(HASH))
+
+    def test_no_infohash(self):
+        assert_that(get_infohash('http://example.org/x.torrent'), equal_to('http://example.org/x.torrent'))
+
+    def test_torrent_deduplicates_links(self):
+        torrent = Torrent(None, [result(HASH), result(HASH.upper(), name='other'), result(HASH_2)])
+        assert_that(torrent.infohashes, equal_to([HASH, HASH_2]))
+        assert_that(len(torrent), equal_to(2))
+
+    def test_prefer_cached(self):
+        torrent = Torrent(None, [result(HASH), result('a' * 40), result(HASH_2)])
+        torrent.prefer({HASH_2})
+        assert_that(torrent.infohashes, equal_to([HASH_2, HASH, 'a' * 40]))
+        assert_that(torrent.links[0], contains_string(HASH_2))
+
+
+class DeduplicationTester(unittest.TestCase):
+    def setUp(self):
+        self.show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759}, TheTVDBAPI(test=True))
+        self.episodes = [Episode(self.show, {'airedSeason': 2, 'airedEpisodeNumber': i, 'episodeName': str(i)})
+                         for i in (13, 14)]
+        self._class = Status2Torrent.__new__(Status2Torrent)
+        self._class.claims = {}
+
+    def test_same_best_link_is_satisfied(self):
+        torrents = self._class._deduplicate(self.show, [Torrent(self.episodes[0], [result(HASH)]),
+                                                        Torrent(self.episodes[1], [result(HASH), result(HASH_2)])])
+        assert_that(len(torrents), equal_to(1))
+        assert_that([r[1].reference for r in self._class.claims[HASH]], equal_to(self.episodes))
+
+    def test_fallback_after_failure(self):
+        torrents = self._class._deduplicate(self.show, [Torrent(self.episodes[0], [result(HASH)]),
+                                                        Torrent(self.episodes[1], [result(HASH), result(HASH_2)])])
+        fallbacks = self._class.get_fallbacks(torrents[0])
+        assert_that([(show, t.reference, t.infohashes) for show, t in fallbacks],
+                    equal_to([(self.show, self.episodes[1], [HASH_2])]))
+        assert_that(self._class.get_fallbacks(torrents[0]), equal_to([]))
+
+    def test_no_fallback_without_other_links(self):
+        torrents = self._class._deduplicate(self.show, [Torrent(self.episodes[0], [result(HASH)]),
+                                                        Torrent(self.episodes[1], [result(HASH)])])
+        assert_that(self._class.get_fallbacks(torrents[0]), equal_to([]))
+
+    def test_claimed_fallback_links_are_removed(self):
+        torrents = self._class._deduplicate(self.show, [Torrent(self.episodes[0], [result(HASH)]),
+                                                        Torrent(self.episodes[1], [result(HASH_2), result(HASH)])])
+        assert_that(len(torrents), equal_to(2))
+        assert_that(torrents[1].infohashes, equal_to([HASH_2]))
+
+
+class RankingTester(unittest.TestCase):
+    def setUp(self):
+        show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759}, TheTVDBAPI(test=True))
+        self.episode = Episode(show, {'airedSeason': 2, 'airedEpisodeNumber': 13, 'episodeName': 'Luthors'})
+        self._class = Status2Torrent.__new__(Status2Torrent)
+        self._class.size_bounds = Status2Torrent.SIZE_BOUNDS
+
+    @staticmethod
+    def _result(title, seeders, size):
+        return PirateBayResult.from_dict({'title': title, 'seeders': seeders, 'size': size,
+                                          'uploaded': datetime.date.today().isoformat()})
+
+    def test_prefers_smaller_of_similar_seeders(self):
+        results = [self._result('remux', 100, 3800 << 20), self._result('hdtv', 90, 300 << 20)]
+        assert_that([r.title for r in self._class.sort_results(results, self.episode)], equal_to(['hdtv', 'remux']))
+
+    def test_seeders_still_matter(self):
+        results = [self._result('dead', 1, 300 << 20), self._result('big', 500, 1500 << 20)]
+        assert_that([r.title for r in self._class.sort_results(results, self.episode)], equal_to(['big', 'dead']))
+
+    def test_size_bounds_filter(self):
+        self._class.quality, self._class._matchers = [{}], {}
+        results = [self._result('Supergirl.S02E13.remux', 100, 8 << 30), self._result('Supergirl.S02E13', 5, 0)]
+        assert_that([r.title for r in self._class.filter_searches(results, self.episode, self.episode.show)],
+                    equal_to(['Supergirl.S02E13']))
+
+
+class SeasonCostTester(unittest.TestCase):
+    def setUp(self):
+        show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759}, TheTVDBAPI(test=True))
+        for i in range(1, 11):
+            show._add_episode(Episode(show, {'airedSeason': 2, 'airedEpisodeNumber': i, 'episodeName': str(i),
+                                             'firstAired': '2017-01-01'}))
+        self.season = show.seasons[2]
+        self._class = Status2Torrent.__new__(Status2Torrent)
+
+    @staticmethod
+    def _result(size):
+        return PirateBayResult.from_dict({'title': 'x', 'size': size})
+
+    def test_pack_cheaper_for_many_episodes(self):
+        episodes = self.season.episodes[:8]
+        episode_results = {ep.episode: [self._result(400 << 20)] for ep in episodes}
+        assert_that(self._class._pack_is_cheaper(self._result(3500 << 20), self.season, episodes, episode_results),
+                    equal_to(True))
+
+    def test_episodes_cheaper_for_few_episodes(self):
+        episodes = self.season.episodes[:2]
+        episode_results = {ep.episode: [self._result(400 << 20)] for ep in episodes}
+        assert_that(self._class._pack_is_cheaper(self._result(3500 << 20), self.season, episodes, episode_results),
+                    equal_to(False))
+
+    def test_unmatched_episodes_are_estimated(self):
+        episodes = self.season.episodes[:6]
+        episode_results = {ep.episode: [] for ep in episodes}
+        episode_results[1] = [self._result(400 << 20)]
+        assert_that(self._class._pack_is_cheaper(self._result(3000 << 20), self.season, episodes, episode_results),
+                    equal_to(True))
+
+
+    def test_pack_of_finished_season_is_complete(self):
+        pack = self._result(3500 << 20)
+        assert_that(self._class._pack_is_complete(pack, self.season), equal_to(True))
+        pack.uploaded = datetime.date(2017, 2, 1)
+        assert_that(self._class._pack_is_complete(pack, self.season), equal_to(True))
+
+    def test_pack_before_last_episode_is_incomplete(self):
+        pack = self._result(3500 << 20)
+        pack.uploaded = datetime.date(2016, 12, 1)
+        assert_that(self._class._pack_is_complete(pack, self.season), equal_to(False))
+
+    def test_pack_of_airing_season_is_incomplete(self):
+        self.season.show._add_episode(Episode(self.season.show, {
+            'airedSeason': 2, 'airedEpisodeNumber': 11, 'episodeName': '11',
+            'firstAired': (datetime.date.today() + datetime.timedelta(days=7)).isoformat()}))
+        assert_that(self._class._pack_is_complete(self._result(3500 << 20), self.season), equal_to(False))
+
+
+class SeasonSearchTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759}, TheTVDBAPI(test=True))
+        for i in range(1, 4):
+            self.show._add_episode(Episode(self.show, {'airedSeason': 2, 'airedEpisodeNumber': i,
+                                                       'episodeName': str(i), 'firstAired': '2017-01-01'}))
+        self.season = self.show.seasons[2]
+        self.searches = []
+        self.pages = [[result('{:040x}'.format(i), name='Supergirl.S02E01.HDTV.x264-{}'.format(i))
+                       for i in range(30)],
+                      [result(HASH, name='Supergirl.S02E02.HDTV.x264-LOL')]]
+
+        async def search(show, object_, page=0):
+            self.searches.append((repr(object_), page))
+            if hasattr(object_, 'episode'):
+                return [result(HASH_2, name='Supergirl.S02E03.HDTV.x264-LOL')] if object_.episode == 3 else []
+            return self.pages[page] if page < len(self.pages) else []
+
+        self._class = Status2Torrent.__new__(Status2Torrent)
+        self._class.torrent_grabber = MagicMock(search=search, RESULTS_PER_PAGE=30)
+        self._class.size_bounds, self._class.quality, self._class._matchers = Status2Torrent.SIZE_BOUNDS, [{}], {}
+
+    def test_episodes_bucketed_from_paginated_season_search(self):
+        torrents, unmatched = self.event_loop.run_until_complete(self._class._search_season(self.show, self.season))
+        # A full page is followed by the next one, a short page ends the search
+        assert_that(self.searches, equal_to([('Season 2', 0), ('Season 2', 1)]))
+        assert_that([(repr(t.reference), len(t)) for t in torrents], equal_to([('s02e01', 30), ('s02e02', 1)]))
+        assert_that(unmatched, equal_to([self.season.episodes[2]]))
+
+    def test_pack_of_airing_season_is_not_offered(self):
+        self.show._add_episode(Episode(self.show, {
+            'airedSeason': 2, 'airedEpisodeNumber': 4, 'episodeName': '4',
+            'firstAired': (datetime.date.today() + datetime.timedelta(days=7)).isoformat()}))
+        self.pages = [[result(HASH, name='Supergirl.S02.720p.HDTV.x264-LOL'),
+                       result(HASH_2, name='Supergirl.S02E01.HDTV.x264-LOL')]]
+        torrents, unmatched = self.event_loop.run_until_complete(
+            self._class._search_season(self.show, self.season, self.season.get_aired_episodes()))
+        assert_that([repr(t.reference) for t in torrents], equal_to(['s02e01']))
+        assert_that(len(unmatched), equal_to(2))
+
+    def test_paging_stops_once_all_episodes_are_found(self):
+        torrents, unmatched = self.event_loop.run_until_complete(
+            self._class._search_season(self.show, self.season, self.season.episodes[:1]))
+        assert_that(self.searches, equal_to([('Season 2', 0)]))
+        assert_that([repr(t.reference) for t in torrents], equal_to(['s02e01']))
+
+    def test_unmatched_episodes_are_searched_separately(self):
+        async def consume():
+            return [torrent async for torrent in self._class.iter_torrents(information)]
+
+        information = MagicMock(show=self.show)
+        information.status.seasons_missing = [self.season]
+        information.status.episodes_missing = []
+        self._class.claims = {}
+        torrents = self.event_loop.run_until_complete(consume())
+        assert_that(self.searches[2:], equal_to([('s02e03', 0)]))
+        assert_that([repr(t.reference) for t in torrents], equal_to(['s02e01', 's02e02', 's02e03']))
+        assert_that(torrents[2].infohashes, equal_to([HASH_2]))
+
+    def tearDown(self):
+        self.event_loop.close()
+
+
+class StreamingSearchTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759}, TheTVDBAPI(test=True))
+        for i in (13, 14):
+            self.show._add_episode(Episode(self.show, {'airedSeason': 2, 'airedEpisodeNumber': i,
+                                                       'episodeName': str(i), 'firstAired': '2017-01-01'}))
+        self.events = []
+
+        async def search(show, object_, page=0):
+            if hasattr(object_, 'episode'):
+                # The separate search of the episode that was not in the season results is slow
+                await asyncio.sleep(0.05)
+                self.events.append('episode search done')
+                return [result(HASH_2, name='Supergirl.S02E14.HDTV.x264-LOL')]
+            return [result(HASH)]
+
+        self._class = Status2Torrent.__new__(Status2Torrent)
+        self._class.torrent_grabber = MagicMock(search=search, RESULTS_PER_PAGE=30)
+        self._class.size_bounds, self._class.quality, self._class._matchers = Status2Torrent.SIZE_BOUNDS, [{}], {}
+        self._class.claims = {}
+        self.information = MagicMock(show=self.show)
+        self.information.status.seasons_missing = []
+        self.information.status.episodes_missing = list(self.show.seasons[2].episodes)
+
+    def test_single_missing_episode_is_searched_directly(self):
+        async def consume():
+            return [torrent async for torrent in self._class.iter_torrents(self.information)]
+
+        self.information.status.episodes_missing = self.show.seasons[2].episodes[1:]
+        torrents = self.event_loop.run_until_complete(consume())
+        # No season search before it
+        assert_that(self.events, equal_to(['episode search done']))
+        assert_that([repr(t.reference) for t in torrents], equal_to(['s02e14']))
+
+    def test_yields_before_all_searches_are_done(self):
+        async def consume():
+            async for torrent in self._class.iter_torrents(self.information):
+                self.events.append(repr(torrent.reference))
+
+        self.event_loop.run_until_complete(consume())
+        assert_that(self.events, equal_to(['s02e13', 'episode search done', 's02e14']))
+
+    def tearDown(self):
+        self.event_loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
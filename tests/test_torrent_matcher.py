@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from hamcrest import *
+from a_argument_to_show.thetvdb_api import TheTVDBAPI, TVDBShow, Episode
+from c_status_to_torrent.piratebay import PirateBayResult
+from c_status_to_torrent.status2torrent import TorrentMatcher
+
+
+class TorrentMatcherTester(unittest.TestCase):
+    def setUp(self):
+        show = TVDBShow({'seriesName': 'Supergirl', 'id': 295759, 'firstAired': '2015-10-26'}, TheTVDBAPI(test=True))
+        episode = Episode(show, {'airedSeason': 2, 'airedEpisodeNumber': 13, 'episodeName': 'Luthors'})
+        self._class = TorrentMatcher(show, episode, [{'quality': '480', 'encoder': '264'}])
+        self.profile = TorrentMatcher(show, episode, [{'quality': '1080', 'encoder': '265'},
+                                                      {'quality': '1080', 'encoder': '264'},
+                                                      {'quality': '720', 'encoder': 'all'}])
+
+    @staticmethod
+    def _result(title):
+        return PirateBayResult.from_dict({'title': title})
+
+    def test_match(self):
+        assert_that(self._class.tier(self._result('Supergirl.S02E13.HDTV.x264-LOL[ettv]')), equal_to(0))
+
+    def test_case_insensitive_filters(self):
+        assert_that(self._class.tier(self._result('Supergirl s02e13 hdtv H264')), equal_to(0))
+
+    def test_wrong_episode(self):
+        assert_that(self._class.tier(self._result('Supergirl.S02E14.HDTV.x264-LOL[ettv]')), none())
+
+    def test_wrong_encoder(self):
+        assert_that(self._class.tier(self._result('Supergirl.S02E13.HDTV.XviD-LOL[ettv]')), none())
+
+    def test_filter_batch(self):
+        results = [self._result(t) for t in ['Supergirl.S02E13.HDTV.x264', 'Supergirl.S02E13.720p.x265',
+                                             'Supernatural.S02E13.HDTV.x264', 'Supergirl 2x13 WEB-DL x264']]
+        assert_that([r.title for r in self._class.filter(results)],
+                    equal_to(['Supergirl.S02E13.HDTV.x264', 'Supergirl 2x13 WEB-DL x264']))
+
+    def test_tier(self):
+        assert_that(self.profile.tier(self._result('Supergirl.S02E13.1080p.x264')), equal_to(1))
+        assert_that(self.profile.tier(self._result('Supergirl.S02E13.480p.x264')), none())
+
+    def test_filter_best_tier(self):
+        results = [self._result(t) for t in ['Supergirl.S02E13.720p.x264', 'Supergirl.S02E13.1080p.x264',
+                                             'Supergirl.S02E14.1080p.x265', 'Supergirl.S02E13.1080p.H264']]
+        assert_that([r.title for r in self.profile.filter(results)],
+                    equal_to(['Supergirl.S02E13.1080p.x264', 'Supergirl.S02E13.1080p.H264']))
+
+    def test_filter_fallback_tier(self):
+        results = [self._result(t) for t in ['Supergirl.S02E13.720p.x264', 'Supergirl.S02E13.480p.x265']]
+        assert_that([r.title for r in self.profile.filter(results)], equal_to(['Supergirl.S02E13.720p.x264']))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+
+from hamcrest import *
+from d_torrent_to_download.transfer_poller import TransferPoller
+
+
+class FakeDownloader:
+    def __init__(self, transfers):
+        self.transfers = transfers
+        self.requests = 0
+
+    async def get_transfers(self):
+        self.requests += 1
+        for transfer in self.transfers:
+            transfer.progress = min(1., transfer.progress + .25)
+        return list(self.transfers)
+
+
+class TransferPollerTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        self.transfers = [MagicMock(id=i, progress=0.) for i in range(50)]
+        self.downloader = FakeDownloader(self.transfers)
+        self._class = TransferPoller(self.downloader, self.event_loop, fast=.001, normal=.002, slow=.003)
+
+    def test_one_request_for_all_waiters(self):
+        async def wait_all():
+            return await asyncio.gather(*[self._class.get_transfer(t) for t in self.transfers])
+
+        updated = self.event_loop.run_until_complete(wait_all())
+        assert_that(self.downloader.requests, equal_to(1))
+        assert_that([t.id for t in updated], equal_to(list(range(50))))
+
+    def test_vanished_transfer(self):
+        updated = self.event_loop.run_until_complete(self._class.get_transfer(MagicMock(id='gone')))
+        assert_that(updated, none())
+
+    def test_interval(self):
+        assert_that(self._class._get_interval([MagicMock(id=1, progress=.3)]), equal_to(self._class.normal))
+        assert_that(self._class._get_interval([MagicMock(id=1, progress=.3)]), equal_to(self._class.slow))
+        assert_that(self._class._get_interval([MagicMock(id=1, progress=.95)]), equal_to(self._class.fast))
+
+    def tearDown(self):
+        self.event_loop.run_until_complete(self._class.close())
+        self.event_loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+
+from hamcrest import *
+from a_argument_to_show.thetvdb_api import TheTVDBAPI, TVDBShow, Episode
+from d_torrent_to_download.transfer_registry import TransferRegistry, get_show_key
+
+HASH = '430ae2f38babd312fa535ef7f02c728318fe1782'
+
+
+class FakeDownloader:
+    def __init__(self, transfers):
+        self.transfers = transfers
+        self.requests = 0
+
+    async def get_transfers(self):
+        self.requests += 1
+        return self.transfers
+
+
+def transfer(name, src=''):
+    transfer_ = MagicMock(src=src, hash=None)
+    transfer_.name = name
+    return transfer_
+
+
+class TransferRegistryTester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        self.show = TVDBShow({'seriesName': 'Doctor Who (2005)', 'id': 78804}, TheTVDBAPI(test=True))
+        self.episode = Episode(self.show, {'airedSeason': 10, 'airedEpisodeNumber': 5, 'episodeName': 'Oxygen'})
+        self.transfers = [transfer('Doctor.Who.2005.S10E05.720p.HDTV.x264-FoV', 'magnet:?xt=urn:btih:' + HASH),
+                          transfer('Supergirl.S02E13.HDTV.x264-LOL[ettv]')]
+        self.downloader = FakeDownloader(self.transfers)
+        self._class = TransferRegistry(self.downloader, self.event_loop, refresh_every=60)
+        self.event_loop.run_until_complete(self._class.refresh())
+
+    def test_show_key(self):
+        assert_that(get_show_key('Doctor Who (2005)'), equal_to(('doctor', 'who')))
+        assert_that(get_show_key('1983'), equal_to(('1983',)))
+
+    def test_lookup_by_reference(self):
+        assert_that(self._class.get_for_reference(self.show, self.episode), same_instance(self.transfers[0]))
+
+    def test_lookup_by_infohash(self):
+        assert_that(self._class.get_by_infohash(HASH), same_instance(self.transfers[0]))
+
+    def test_refresh_is_scheduled(self):
+        self.event_loop.run_until_complete(self._class.refresh())
+        assert_that(self.downloader.requests, equal_to(1))
+        self.event_loop.run_until_complete(self._class.refresh(force=True))
+        assert_that(self.downloader.requests, equal_to(2))
+
+    def tearDown(self):
+        self.event_loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
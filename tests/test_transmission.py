@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from aiohttp import web
+from hamcrest import *
+from d_torrent_to_download.disk_space import DiskSpaceAdmission
+from d_torrent_to_download.torrent2download import download_transfer
+from d_torrent_to_download.transmission import TransmissionAPI
+
+SESSION_ID = 'abc123'
+NAME = 'Supergirl.S02E13.720p.HDTV.x264-SVA'
+
+
+class TransmissionAPITester(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.event_loop)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.temp_dir.name, 'data')
+        self.library = os.path.join(self.temp_dir.name, 'library')
+        os.makedirs(os.path.join(self.data_dir, NAME))
+        with open(os.path.join(self.data_dir, NAME, NAME + '.mkv'), 'wb') as f:
+            f.write(b'x' * 100)
+        self.torrents = {}
+
+        async def handle(request):
+            if request.headers.get('Authorization') != 'Basic dXNlcjpwdw==':
+                return web.Response(status=401)
+            if request.headers.get('X-Transmission-Session-Id') != SESSION_ID:
+                return web.Response(status=409, headers={'X-Transmission-Session-Id': SESSION_ID})
+            body = await request.json()
+            arguments = body['arguments']
+            if body['method'] == 'torrent-add':
+                torrent = {'id': len(self.torrents) + 1, 'name': NAME, 'hashString': 'ab' * 20, 'percentDone': 0.,
+                           'error': 0, 'downloadDir': self.data_dir,
+                           'files': [{'name': NAME + '/' + NAME + '.mkv', 'length': 100, 'bytesCompleted': 0},
+                                     {'name': NAME + '/' + NAME + '.nfo', 'length': 1, 'bytesCompleted': 0}]}
+                self.torrents[torrent['id']] = torrent
+                return web.json_response({'result': 'success', 'arguments': {'torrent-added': torrent}})
+            if body['method'] == 'torrent-get':
+                ids = arguments.get('ids', list(self.torrents))
+                return web.json_response({'result': 'success', 'arguments': {
+                    'torrents': [self.torrents[i] for i in ids if i in self.torrents]}})
+            if body['method'] == 'torrent-remove':
+                [self.torrents.pop(i, None) for i in arguments['ids']]
+                return web.json_response({'result': 'success', 'arguments': {}})
+            return web.json_response({'result': 'method name not recognized'})
+
+        app = web.Application()
+        app.router.add_post('/transmission/rpc', handle)
+        self.runner = web.AppRunner(app)
+        self.event_loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.event_loop.run_until_complete(site.start())
+        url = 'http://user:pw@127.0.0.1:{}/transmission/rpc'.format(site._server.sockets[0].getsockname()[1])
+        self._class = TransmissionAPI(url, self.event_loop)
+
+    def _finish(self, torrent_id):
+        self.torrents[torrent_id]['percentDone'] = 1.
+        for file_ in self.torrents[torrent_id]['files']:
+            file_['bytesCompleted'] = file_['length']
+
+    def test_parse_login(self):
+        assert_that(self._class._parse_login('user:pw'),
+                    equal_to((TransmissionAPI.DEFAULT_URL, {'Authorization': 'Basic dXNlcjpwdw=='})))
+        assert_that(self._class.url, ends_with('/transmission/rpc'))
+        assert_that(self._class.url, is_not(contains_string('user')))
+
+    def test_lifecycle(self):
+        transfer = self.event_loop.run_until_complete(self._class.upload('magnet:?xt=urn:btih:' + 'ab' * 20))
+        assert_that((transfer.id, transfer.hash), equal_to((1, 'ab' * 20)))
+        assert_that(self._class.is_transfer_finished(transfer, None), equal_to(None))
+
+        self._finish(1)
+        transfer = self.event_loop.run_until_complete(self._class.get_transfer(transfer))
+        assert_that(self._class.is_transfer_finished(transfer, None), equal_to(True))
+        assert_that(self.event_loop.run_until_complete(self._class.download_transfer(transfer, self.library)),
+                    equal_to(True))
+        # Hardlinked, not copied, and only the video
+        target = os.path.join(self.library, NAME + '.mkv')
+        assert_that(os.listdir(self.library), equal_to([NAME + '.mkv']))
+        assert_that(os.stat(target).st_ino, equal_to(os.stat(os.path.join(self.data_dir, NAME, NAME + '.mkv')).st_ino))
+
+        self.event_loop.run_until_complete(self._class.delete(transfer))
+        assert_that(self.event_loop.run_until_complete(self._class.get_transfers()), equal_to([]))
+        assert_that(self.event_loop.run_until_complete(self._class.get_transfer(transfer)), equal_to(None))
+
+    def test_hardlinks_fit_on_a_full_disk(self):
+        transfer = self.event_loop.run_until_complete(self._class.upload('magnet:x'))
+        self._finish(1)
+        transfer = self.event_loop.run_until_complete(self._class.get_transfer(transfer))
+        files = self.event_loop.run_until_complete(self._class.get_files_from_transfer(transfer))
+        assert_that(self._class.get_bytes_to_write(files, self.library), equal_to(0))
+        admission = DiskSpaceAdmission(margin=0, disk_usage=lambda path: MagicMock(free=0))
+        assert_that(self.event_loop.run_until_complete(download_transfer(self._class, transfer, self.library,
+                                                                         admission=admission)), equal_to(True))
+        assert_that(os.listdir(self.library), equal_to([NAME + '.mkv']))
+
+    def test_incomplete(self):
+        transfer = self.event_loop.run_until_complete(self._class.upload('magnet:x'))
+        assert_that(self.event_loop.run_until_complete(self._class.download_transfer(transfer, self.library)),
+                    equal_to(False))
+        self.torrents[1]['error'] = TransmissionAPI.LOCAL_ERROR
+        transfer = self.event_loop.run_until_complete(self._class.get_transfer(transfer))
+        assert_that(self._class.is_transfer_finished(transfer, None), equal_to(False))
+
+    def tearDown(self):
+        self.event_loop.run_until_complete(self._class.close())
+        self.event_loop.run_until_complete(self.runner.cleanup())
+        self.event_loop.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()